@@ -1,7 +1,19 @@
+import json
 import os
+import re
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 import pandas as pd
-from vertexai.generative_models import GenerativeModel
-import vertexai 
+from review_engine import MAX_IN_FLIGHT
+from syntax_check import SQL_DIALECT
+from telemetry import UsageRecorder
+from vertex_client import LazyModel
+
+try:
+    import sqlglot
+    from sqlglot import exp
+    from sqlglot.errors import SqlglotError
+except ImportError:  # generated expressions are then used without local validation
+    sqlglot = None
 
 # Constants
 GOOGLE_APPLICATION_CREDENTIALS = "service.json"
@@ -9,29 +21,130 @@ EXCEL_DIRECTORY = "xl"  # Path to the directory containing Excel files
 PROJECT_ID = "cedar-context-433909-d9"
 LOCATION = "us-central1"
 GENERATIVE_MODEL_NAME = "gemini-1.5-flash-001"
-OUTPUT_SQL_FILE = "bigquery_inserts.sql"  # Output SQL file
+OUTPUT_SQL_FILE = "bigquery_inserts.sql"  # Output SQL file suffix, one file per target table
+OUTPUT_SQL_DIRECTORY = "generated_sql"
+MAPPING_EXTENSIONS = (".xlsx", ".xlsm", ".xls", ".csv", ".parquet")
+# Only these columns are kept from a mapping sheet
+MAPPING_COLUMNS = ["source_table", "target_table", "source_column", "transformation_logic", "target_column"]
+# Workbooks larger than this are read row by row with openpyxl's read-only reader
+LARGE_WORKBOOK_BYTES = 5 * 1024 * 1024
+PARSE_WORKERS = os.cpu_count() or 1
+# Unique transformation descriptions sent to the model in one request
+DESCRIPTIONS_PER_REQUEST = 50
+# Generated expressions refer to the row's source column with this placeholder
+COLUMN_PLACEHOLDER = "{column}"
+# Shared by the batched and the single-description prompts, so both return placeholder expressions
+EXPRESSION_INSTRUCTIONS = f"""Generate a single BigQuery SQL expression (not a full statement) that can be used in a SELECT
+list. Write {COLUMN_PLACEHOLDER} wherever the expression uses the column being transformed."""
+SQL_FENCE = re.compile(r"```(?:sql)?\s*(.*?)```", re.S | re.I)
+# sqlglot highlights the failing token with terminal colour codes
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*m")
+
+EXPRESSION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "expressions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "integer"},
+                    "sql": {"type": "string"},
+                },
+                "required": ["id", "sql"],
+            },
+        },
+    },
+    "required": ["expressions"],
+}
+
+# One client for the whole run; Vertex AI is initialized on the first model call
+model = LazyModel(GENERATIVE_MODEL_NAME, PROJECT_ID, LOCATION, GOOGLE_APPLICATION_CREDENTIALS)
+usage = UsageRecorder()
+
+def read_large_workbook(file_path):
+    """Streams the first sheet of a large .xlsx with openpyxl in read-only mode, keeping MAPPING_COLUMNS."""
+    from openpyxl import load_workbook
 
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = GOOGLE_APPLICATION_CREDENTIALS
-vertexai.init(project=PROJECT_ID, location=LOCATION)
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        keep = [index for index, name in enumerate(header) if name in MAPPING_COLUMNS]
+        data = [
+            [row[index] if index < len(row) else None for index in keep]
+            for row in rows
+            if any(value is not None for value in row)
+        ]
+        return pd.DataFrame(data, columns=[header[index] for index in keep])
+    finally:
+        workbook.close()
 
-model = GenerativeModel(GENERATIVE_MODEL_NAME)
 
-def load_excel_files_from_directory(directory):
-    """Load all Excel files from a specified directory into DataFrames."""
-    dataframes = []
-    for file_name in os.listdir(directory):
-        if file_name.endswith(".xlsx") or file_name.endswith(".xls"):
-            file_path = os.path.join(directory, file_name)
-            df = pd.read_excel(file_path)
-            dataframes.append((file_name, df))
-    return dataframes
+def load_mapping_file(file_path):
+    """Parses one mapping sheet (Excel, CSV or Parquet) into a DataFrame; runs in a worker process."""
+    keep_column = lambda name: name in MAPPING_COLUMNS
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".csv":
+        return pd.read_csv(file_path, usecols=keep_column)
+    if extension == ".parquet":
+        df = pd.read_parquet(file_path)
+        return df[[name for name in df.columns if name in MAPPING_COLUMNS]]
+    if extension != ".xls" and os.path.getsize(file_path) > LARGE_WORKBOOK_BYTES:
+        return read_large_workbook(file_path)
+    return pd.read_excel(file_path, usecols=keep_column)
+
+
+def iter_mapping_files(directory, max_workers=PARSE_WORKERS):
+    """Parses mapping sheets in a process pool and yields (file_name, df) as each one is ready.
+
+    At most two sheets per worker are parsed ahead of the consumer, so memory stays bounded
+    while parsing overlaps with SQL generation.
+    """
+    file_names = sorted(name for name in os.listdir(directory) if name.lower().endswith(MAPPING_EXTENSIONS))
+    pending = iter(file_names)
+    with ProcessPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        in_flight = {}
+        while True:
+            while len(in_flight) < max(1, max_workers) * 2:
+                file_name = next(pending, None)
+                if file_name is None:
+                    break
+                in_flight[executor.submit(load_mapping_file, os.path.join(directory, file_name))] = file_name
+            if not in_flight:
+                return
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_name = in_flight.pop(future)
+                try:
+                    yield file_name, future.result()
+                except Exception as e:
+                    print(f"Error reading {file_name}: {e}")
+
+def description_key(description):
+    """Normalizes a description so rows with the same logic share one generated expression."""
+    return " ".join(str(description).lower().split()).rstrip(".")
+
+
+def clean_sql(sql_text):
+    """Strips code fences, keeping only the fenced SQL when the model wrapped it in prose."""
+    fenced = SQL_FENCE.search(sql_text)
+    if fenced:
+        return fenced.group(1).strip()
+    return sql_text.replace("```sql", "").replace("```", "").strip()
+
 
 def generate_sql_from_description(description):
-    """Use Vertex AI to generate SQL from a description."""
-    model = GenerativeModel(GENERATIVE_MODEL_NAME)
+    """Use Vertex AI to generate a placeholder SQL expression from one description."""
+    prompt = f"""You are a BigQuery SQL expert with extensive experience generating SQL statements.
+{EXPRESSION_INSTRUCTIONS}
+Return only the expression, with no explanation.
 
-    prompt = f"You are a BigQuery SQL expert with extensive experience generating SQL statements. Generate a BigQuery SQL expression for the following transformation description: {description}"
-    response = model.generate_content(
+Transformation description: {description}"""
+    response = usage.call(
+        description[:60],
+        GENERATIVE_MODEL_NAME,
+        model.generate_content,
         prompt,
         generation_config={
             "max_output_tokens": 512,
@@ -41,58 +154,248 @@ def generate_sql_from_description(description):
     )
     return response.text
 
-def generate_bigquery_insert_query(df):
-    """Generate a single BigQuery INSERT statement based on transformations for multiple columns."""
-    source_table = df['source_table'][0]  # Assuming the same source table for all rows
-    target_table = df['target_table'][0]  # Assuming the same target table for all rows
-    assignments = []
 
-    for _, row in df.iterrows():
-        source_column = row['source_column']
-        transformation_logic = row['transformation_logic']
-        target_column = row['target_column']
+def generate_sql_batch(descriptions):
+    """Generates one SQL expression per description in a single request; returns {index: sql}."""
+    from vertexai.generative_models import GenerationConfig
+
+    numbered = "\n".join(f"{index}: {description}" for index, description in enumerate(descriptions))
+    prompt = f"""You are a BigQuery SQL expert with extensive experience generating SQL statements.
+For each numbered transformation description below:
+{EXPRESSION_INSTRUCTIONS}
+Return one entry per description, with its number as id.
 
-        # Generate SQL using Vertex AI based on transformation logic
-        transformed_column_sql = generate_sql_from_description(transformation_logic).strip()
+{numbered}
+"""
+    response = usage.call(
+        f"{len(descriptions)} descriptions starting with {descriptions[0][:40]}",
+        GENERATIVE_MODEL_NAME,
+        model.generate_content,
+        prompt,
+        generation_config=GenerationConfig(
+            max_output_tokens=8192,
+            temperature=0.2,
+            top_p=0.95,
+            response_mime_type="application/json",
+            response_schema=EXPRESSION_SCHEMA,
+        ),
+    )
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", response.text.strip())
+    expressions = json.loads(text).get("expressions", [])
+    return {
+        int(entry["id"]): clean_sql(str(entry["sql"]))
+        for entry in expressions
+        if str(entry.get("id", "")).isdigit() and int(entry["id"]) < len(descriptions) and str(entry.get("sql", "")).strip()
+    }
+
+
+def generate_sql_for_descriptions(descriptions, batch_size=DESCRIPTIONS_PER_REQUEST, max_in_flight=MAX_IN_FLIGHT):
+    """Generates SQL for every unique description in concurrent batched requests; returns {key: sql}.
 
-        # Ensure proper SQL assignment
-        if not transformed_column_sql.lower().startswith("select"):
-            transformed_column_sql = transformed_column_sql.replace("```sql", "").replace("```", "").strip()
+    Descriptions that a batch leaves out, or whose batch fails, are generated one at a time.
+    """
+    unique = {}
+    for description in descriptions:
+        unique.setdefault(description_key(description), description)
+    keys = list(unique)
+    batches = [keys[start:start + batch_size] for start in range(0, len(keys), batch_size)]
+    print(f"{len(descriptions)} descriptions, {len(keys)} unique, in {len(batches)} request(s)")
+
+    def run_batch(batch):
+        try:
+            generated = generate_sql_batch([unique[key] for key in batch])
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            print(f"WARNING: Batched SQL generation failed ({e}); generating its descriptions one at a time.")
+            generated = {}
+        return {
+            key: generated[index] if index in generated else clean_sql(generate_sql_from_description(unique[key]))
+            for index, key in enumerate(batch)
+        }
 
-        # Prepare assignment for the SQL SELECT statement
-        assignments.append(f"{transformed_column_sql} AS {target_column}")
+    expressions = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_in_flight, len(batches)))) as executor:
+        for generated in executor.map(run_batch, batches):
+            expressions.update(generated)
+    return expressions
 
-    # Combine assignments into a single SQL query
+
+def expression_error(sql, known_columns):
+    """Returns why a generated expression is invalid, or "" if it parses and uses only known columns."""
+    try:
+        parsed = sqlglot.parse_one(f"SELECT {sql}", read=SQL_DIALECT)
+    except SqlglotError as e:
+        return f"{SQL_DIALECT} SQL parse error: {ANSI_ESCAPE.sub('', str(e))}"
+    # " AS target_column" is appended to the expression, so it must be exactly one unaliased expression
+    clauses = [key for key, value in parsed.args.items() if value and key != "expressions"]
+    if not isinstance(parsed, exp.Select) or clauses:
+        return "not a single expression; return only the expression, without SELECT, FROM or other clauses"
+    if len(parsed.expressions) != 1:
+        return f"{len(parsed.expressions)} comma-separated expressions; return exactly one expression"
+    if isinstance(parsed.expressions[0], exp.Alias):
+        return "the expression has its own alias; return it without AS or an alias name"
+    if isinstance(parsed.expressions[0], exp.Star):
+        return "SELECT * is not an expression for one column"
+    unknown = sorted({
+        column.sql(dialect=SQL_DIALECT)
+        for column in parsed.find_all(exp.Column)
+        if column.name.lower() not in known_columns and column.table.lower() not in known_columns
+    })
+    if unknown:
+        return f"unknown column(s) {', '.join(unknown)}; the source columns are {', '.join(sorted(known_columns))}"
+    return ""
+
+
+def regenerate_expression(description, sql, error):
+    """Asks again for a placeholder expression, feeding back the invalid SQL and why it failed."""
+    prompt = f"""You are a BigQuery SQL expert. This BigQuery SQL expression was generated for the transformation
+description below, but it is invalid:
+{sql}
+
+Problem: {error}
+
+{EXPRESSION_INSTRUCTIONS}
+Return only the corrected expression, with no explanation.
+Transformation description: {description}"""
+    response = usage.call(
+        f"regenerate {description[:50]}",
+        GENERATIVE_MODEL_NAME,
+        model.generate_content,
+        prompt,
+        generation_config={
+            "max_output_tokens": 512,
+            "temperature": 0.2,
+            "top_p": 0.95,
+        }
+    )
+    return clean_sql(response.text)
+
+
+def repair_expressions(df, generated, transformed, max_in_flight=MAX_IN_FLIGHT):
+    """Validates each row's expression locally and regenerates the failing ones.
+
+    generated holds the placeholder expressions and transformed the same with each row's column
+    filled in. Columns an expression references must be among the source_column values of its
+    source table. Failing rows are regenerated once per (description, source table), however many
+    rows share the description; a failed regeneration keeps the original expression.
+    """
+    if sqlglot is None:
+        print("sqlglot is not installed; generated expressions are not validated locally.")
+        return transformed
+    known = (
+        df["source_column"].astype(str).str.lower()
+        .groupby(df["source_table"]).agg(set).to_dict()
+    )
+    rows = list(zip(df["source_table"], df["source_column"].astype(str), df["transformation_logic"]))
+    errors = {}
+    failing = {}
+    for index, sql in enumerate(transformed):
+        source_table, source_column, description = rows[index]
+        if (sql, source_table) not in errors:
+            errors[(sql, source_table)] = expression_error(sql, known[source_table])
+        error = errors[(sql, source_table)]
+        if not error:
+            continue
+        if pd.isna(description):
+            print(f"WARNING: column {source_column} in {source_table} is invalid ({error}).")
+            continue
+        failing.setdefault((description_key(description), source_table), []).append(index)
+    if not failing:
+        return transformed
+    print(f"{sum(map(len, failing.values()))} of {len(transformed)} generated expressions failed validation; "
+          f"regenerating {len(failing)} of them.")
+
+    def regenerate(group):
+        indexes = failing[group]
+        first = indexes[0]
+        error = errors[(transformed[first], rows[first][0])]
+        try:
+            return regenerate_expression(rows[first][2], generated[first], error), None
+        except Exception as e:
+            return None, e
+
+    repaired = list(transformed)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_in_flight, len(failing)))) as executor:
+        for group, (sql, exception) in zip(failing, executor.map(regenerate, failing)):
+            if exception is not None:
+                print(f"WARNING: regenerating the expression for '{group[0]}' in {group[1]} failed ({exception}); "
+                      f"keeping the original.")
+                continue
+            for index in failing[group]:
+                source_table, source_column, _ = rows[index]
+                candidate = sql.replace(COLUMN_PLACEHOLDER, source_column)
+                error = expression_error(candidate, known[source_table])
+                if error:
+                    print(f"WARNING: expression for {source_column} in {source_table} is still invalid ({error}).")
+                repaired[index] = candidate
+    return repaired
+
+
+def build_insert_query(source_table, target_table, target_columns, assignments):
     assignment_list = ',\n    '.join(assignments)
-    query = f"""
-    INSERT INTO {target_table} ({', '.join(df['target_column'])})
+    return f"""
+    INSERT INTO {target_table} ({', '.join(target_columns)})
     SELECT 
     {assignment_list}
     FROM `{source_table}`;
     """
-    return query
 
 
-def write_query_to_file(query, output_file):
+def generate_bigquery_insert_queries(df):
+    """Yields (target_table, query): one INSERT ... SELECT per (source_table, target_table) in the sheet.
+
+    Every unique description in the sheet is generated once, in concurrent batched requests,
+    before the groups are assembled, so groups sharing logic share the model calls too.
+    """
+    df = df.dropna(subset=["source_table", "target_table", "target_column"])
+    keys = df["transformation_logic"].map(description_key, na_action="ignore")
+    descriptions = df.loc[keys.notna(), "transformation_logic"].astype(str).tolist()
+    expressions = generate_sql_for_descriptions(descriptions) if descriptions else {}
+
+    source_columns = df["source_column"].astype(str)
+    generated = keys.map(expressions)
+    # Rows without a transformation pass their source column through
+    generated = generated.where(generated.notna(), COLUMN_PLACEHOLDER)
+    transformed = [sql.replace(COLUMN_PLACEHOLDER, column) for sql, column in zip(generated, source_columns)]
+    transformed = repair_expressions(df, list(generated), transformed)
+    df = df.assign(
+        target_column=df["target_column"].astype(str),
+        assignment=pd.Series(transformed, index=df.index) + " AS " + df["target_column"].astype(str),
+    )
+
+    for (source_table, target_table), group in df.groupby(["source_table", "target_table"], sort=False):
+        yield str(target_table), build_insert_query(
+            source_table, target_table, group["target_column"].tolist(), group["assignment"].tolist()
+        )
+
+
+def target_sql_file(target_table):
+    """Output .sql path for a target table, e.g. generated_sql/dataset.table_bigquery_inserts.sql."""
+    safe_name = re.sub(r"[^\w.-]", "_", target_table.strip("`"))
+    return os.path.join(OUTPUT_SQL_DIRECTORY, f"{safe_name}_{OUTPUT_SQL_FILE}")
+
+
+def write_query_to_file(query, output_file, mode='w'):
     """Write generated query to a SQL file."""
-    with open(output_file, 'w') as f:
+    with open(output_file, mode) as f:
         f.write(query)
 
 def main():
-    # Load all Excel files from the specified directory
-    excel_files = load_excel_files_from_directory(EXCEL_DIRECTORY)
+    os.makedirs(OUTPUT_SQL_DIRECTORY, exist_ok=True)
+    # Target files written in this run; later queries for the same target are appended
+    written = set()
 
-    for file_name, df in excel_files:
+    # Mapping sheets are parsed in the background and processed as soon as each is ready
+    for file_name, df in iter_mapping_files(EXCEL_DIRECTORY):
         print(f"Processing file: {file_name}")
 
-        # Generate a BigQuery INSERT statement for the current DataFrame
-        bigquery_query = generate_bigquery_insert_query(df)
-
-        # Write the generated SQL to a file
-        output_file = f"{os.path.splitext(file_name)[0]}_{OUTPUT_SQL_FILE}"
-        write_query_to_file(bigquery_query, output_file)
+        # Each (source_table, target_table) group is written as soon as its query is built
+        for target_table, bigquery_query in generate_bigquery_insert_queries(df):
+            output_file = target_sql_file(target_table)
+            write_query_to_file(bigquery_query, output_file, 'a' if output_file in written else 'w')
+            written.add(output_file)
+            print(f"Generated SQL query for {target_table} has been written to {output_file}")
 
-        print(f"Generated SQL query has been written to {output_file}")
+    print(usage.summary())
 
 if __name__ == "__main__":
     main()
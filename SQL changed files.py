@@ -1,13 +1,14 @@
 import os
 import subprocess
-import vertexai
 import time
-from vertexai.generative_models import GenerativeModel
-import vertexai.preview.generative_models as generative_models
+from diff_hunks import diff_excerpt
+from report_writer import HtmlReportWriter
+from telemetry import UsageRecorder, collect_stream
+from vertex_client import LazyModel, block_only_high_safety_settings
 
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "credentials_file.json"
-
-vertexai.init(project="bilvantisaimlproject", location="us-west1")
+GOOGLE_APPLICATION_CREDENTIALS = "credentials_file.json"
+PROJECT_ID = "bilvantisaimlproject"
+LOCATION = "us-west1"
 
 generation_config = {
     "max_output_tokens": 8192,
@@ -15,16 +16,16 @@ generation_config = {
     "top_p": 0.95,
 }
 
-safety_settings = {
-    generative_models.HarmCategory.HARM_CATEGORY_HATE_SPEECH: generative_models.HarmBlockThreshold.BLOCK_ONLY_HIGH,
-    generative_models.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: generative_models.HarmBlockThreshold.BLOCK_ONLY_HIGH,
-    generative_models.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: generative_models.HarmBlockThreshold.BLOCK_ONLY_HIGH,
-    generative_models.HarmCategory.HARM_CATEGORY_HARASSMENT: generative_models.HarmBlockThreshold.BLOCK_ONLY_HIGH,
-}
-
-generative_model = GenerativeModel("gemini-1.5-flash-001")
+GENERATIVE_MODEL_NAME = "gemini-1.5-flash-001"
+# Vertex AI is initialized on the first model call
+generative_model = LazyModel(GENERATIVE_MODEL_NAME, PROJECT_ID, LOCATION, GOOGLE_APPLICATION_CREDENTIALS)
 
 OUTPUT_FILE = "review_summary.html"
+# Review only the changed hunks (plus DIFF_CONTEXT_LINES around them) instead of whole files
+REVIEW_DIFF_HUNKS_ONLY = True
+DIFF_CONTEXT_LINES = 10
+report = HtmlReportWriter(OUTPUT_FILE, title="Python Code Review Summary", append=True)
+usage = UsageRecorder()
 
 
 def read_file_content(file_path):
@@ -47,30 +48,8 @@ def format_time(seconds):
 
 def append_to_output_file(content, file_name, file_path, time_taken):
     """Append content to the output file as HTML with proper formatting."""
-    if not os.path.exists(OUTPUT_FILE):
-        # If the file doesn't exist, create it with the initial HTML structure
-        with open(OUTPUT_FILE, "w", encoding="utf-8") as output_file:
-            output_file.write(f"""
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Python Code Review Summary</title>
-            <style>
-                body {{ font-family: Arial, sans-serif; margin: 20px; }}
-                h1 {{ color: #34495E; text-align: center; }}
-                pre {{ }}
-            </style>
-        </head>
-        <body>
-            <h1>Python Code Review Summary</h1>
-        </body>
-        </html>
-        """)
-    # Append the formatted review to the file
-    with open(OUTPUT_FILE, "a", encoding="utf-8") as output_file:
-        output_file.write(f"""
+    # The writer keeps the report well-formed and adds to the previous run's report
+    report.write_section(f"""
              <div style="margin-bottom: 20px; border: 1px solid #ccc; padding: 15px; border-radius: 8px; background-color: #f9f9f9;">
                     <h2 style="color: #2C3E50;">Review for {file_name}</h2>
                     <p style="font-style: italic; color: #000000;">File Path: {file_path}</p>
@@ -80,24 +59,32 @@ def append_to_output_file(content, file_name, file_path, time_taken):
         """)
 
 
-def generate_content_for_review(code_content):
+def stream_response(contents):
+    """Streams the model response for the given contents and returns it with the full text collected."""
+    responses = generative_model.generate_content(
+        contents,
+        generation_config=generation_config,
+        safety_settings=block_only_high_safety_settings(),
+        stream=True,
+    )
+    return collect_stream(responses)
+
+
+def generate_content_for_review(code_content, label="review"):
     """Generates a detailed review of the provided code snippet."""
     response_text = ""
     try:
-        responses = generative_model.generate_content(
-            [prompt(code_content)],
-            generation_config=generation_config,
-            safety_settings=safety_settings,
-            stream=True,
-        )
-        for response in responses:
-            response_text += response.text
+        response_text = usage.call(label, GENERATIVE_MODEL_NAME, stream_response, [prompt(code_content)]).text
 
     except ValueError as e:
         if "SAFETY" in str(e):
             print(f"WARNING: Generated content blocked by safety filters: {e}")
         else:
-            raise e
+            response_text = f"Error generating review: {str(e)}"
+    except Exception as e:
+        # Retries or the run budget are used up; only this file needs re-running
+        print(f"Error generating review for {label}: {e}")
+        response_text = f"Error generating review: {str(e)}"
 
     return response_text
 
@@ -239,12 +226,17 @@ def process_changed_files(directory_path):
             if file_path in changed_files and os.path.isfile(file_path):
                 # Read and review the changed file
                 code_content = read_file_content(file_path)
-                code_content_with_line_numbers = add_line_numbers(code_content)
+                code_content_with_line_numbers = None
+                if REVIEW_DIFF_HUNKS_ONLY:
+                    # Send only the changed hunks plus context; line numbers stay those of the file
+                    code_content_with_line_numbers = diff_excerpt(file_path, code_content, DIFF_CONTEXT_LINES)
+                if code_content_with_line_numbers is None:
+                    code_content_with_line_numbers = add_line_numbers(code_content)
                 print(f"\n\nReviewing file: {file_path}")
 
                 start_time = time.time()
 
-                response_text = generate_content_for_review(code_content_with_line_numbers)
+                response_text = generate_content_for_review(code_content_with_line_numbers, file_path)
                 time_taken = time.time() - start_time
 
                 # Append the review response to the output file
@@ -262,6 +254,8 @@ def main():
 
     # Process changed files and generate reviews
     process_changed_files(python_dir)
+    report.close()
+    print(usage.summary())
 
 
 if __name__ == "__main__":
@@ -1,6 +1,9 @@
 import os
-import vertexai
-from vertexai.generative_models import GenerativeModel
+from duplicates import duplicate_findings, duplicate_section_html, find_clones
+from report_writer import HtmlReportWriter
+from review_cache import cache_from_argv, cache_key
+from telemetry import UsageRecorder
+from vertex_client import LazyModel
 
 # Configuration
 GOOGLE_APPLICATION_CREDENTIALS = "service.json"
@@ -9,12 +12,12 @@ LOCATION = "us-central1"
 GENERATIVE_MODEL_NAME = "gemini-1.5-flash-001"
 INPUT_DIRECTORY = "py" 
 OUTPUT_FILE = "review7.html"
-# Set Google Cloud credentials and initialize Vertex AI
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = GOOGLE_APPLICATION_CREDENTIALS
-vertexai.init(project=PROJECT_ID, location=LOCATION)
-
-# Initialize the Generative Model
-model = GenerativeModel(GENERATIVE_MODEL_NAME)
+# Duplicate Code is found locally across all files and shown after the model's four sections
+DUPLICATE_SECTION_NUMBER = 5
+# Vertex AI is initialized on the first model call, so cached runs never load the SDK
+model = LazyModel(GENERATIVE_MODEL_NAME, PROJECT_ID, LOCATION, GOOGLE_APPLICATION_CREDENTIALS)
+review_cache = cache_from_argv()
+usage = UsageRecorder()
 
 def read_file_content(file_path):
     """Reads the content of a file."""
@@ -27,7 +30,7 @@ def add_line_numbers(code_content):
     numbered_lines = [f"Line {i + 1}: {line}" for i, line in enumerate(lines)]
     return '\n'.join(numbered_lines)
 
-def generate_review(code_content):
+def generate_review(code_content, label="review"):
     """Generates a review of the provided code using the AI model."""
     prompt = f"""You are an intelligent AI bot. Review the following code and check if there are any type of errors in the files. If there are any errors, list them clearly in HTML format.
     Please provide the output in HTML format without any spacing or line breaks between the elements
@@ -55,11 +58,7 @@ def generate_review(code_content):
     - ** Explanation **: Provide a clear explanation of each identified vulnerability.
     - ** Fix **: Suggest code changes to mitigate the security risks without rewriting the entire code.
  
-4. ** Duplicate Code :**
-    - ** Identification **: Highlight sections of the code lines that are duplicated.
-    - ** Suggestion **: Provide recommendations without rewriting the entire code.
- 
-5. ** Code Improvement Suggestions :**
+4. ** Code Improvement Suggestions :**
     - ** Identification **: Highlight sections of the code that can be improved.
         - This could include:
         - Unnecessary complexity
@@ -67,8 +66,8 @@ def generate_review(code_content):
         - Potential for using more concise constructs (e.g., list comprehensions, loops)
     - ** Suggestion **: Provide specific points for improvement and the necessary code changes without rewriting the entire code.
     - ** Note **: If no code improvement suggestions are found, simply state "No Code Improvement Suggestions Found."
-6. ** Don't write any kind of code or code snippet in the output: **
-7.Generate the output in a purely HTML format so that the file can be opened and displayed as a proper web page.
+5. ** Don't write any kind of code or code snippet in the output: **
+6.Generate the output in a purely HTML format so that the file can be opened and displayed as a proper web page.
   - Maintain a consistent format for all review responses.
   - Use CSS for styling (not too light or too bright colors)
   - Clearly separate review responses for each file:
@@ -78,40 +77,43 @@ def generate_review(code_content):
       - Populate the rows with detailed content corresponding to each header.
 The code to review:
 {code_content}"""
+    generation_config = {
+        "max_output_tokens": 8192,
+        "temperature": 0.2,
+        "top_p": 0.95,
+    }
+    key = cache_key(code_content, prompt, GENERATIVE_MODEL_NAME, generation_config)
+
     try:
-        response = model.generate_content(
-            prompt,
-            generation_config={
-                "max_output_tokens": 8192,
-                "temperature": 0.2,
-                "top_p": 0.95,
-            }
+        review_text = review_cache.fetch(
+            key,
+            lambda: usage.call(label, GENERATIVE_MODEL_NAME, model.generate_content, prompt, generation_config=generation_config).text,
         )
-        return response.text
+        return review_text
     except Exception as e:
         return f"Error generating review: {str(e)}"
 
-def review_python_files(directory):
-    """Reviews all Python files in the specified directory."""
-    review_results = ""
-    for filename in os.listdir(directory):
-        if filename.endswith(".py"):
-            file_path = os.path.join(directory, filename)
-            code_content = read_file_content(file_path)
-            numbered_code = add_line_numbers(code_content)
-            review = generate_review(numbered_code)
-            review_results += f"<h2>Review for {filename}</h2><pre>{review}</pre>\n"
-    return review_results
+def review_python_files(directory, report):
+    """Reviews all Python files in the specified directory, writing each review as soon as it is ready."""
+    file_paths = [os.path.join(directory, filename) for filename in os.listdir(directory) if filename.endswith(".py")]
+    # Duplicate code is detected locally across all files before any model call
+    duplicates = duplicate_findings(find_clones(file_paths))
+    for file_path in file_paths:
+        filename = os.path.basename(file_path)
+        code_content = read_file_content(file_path)
+        numbered_code = add_line_numbers(code_content)
+        review = generate_review(numbered_code, filename)
+        review += duplicate_section_html(duplicates[file_path], DUPLICATE_SECTION_NUMBER)
+        report.write_section(f"<h2>Review for {filename}</h2><pre>{review}</pre>")
 
 def main():
-    # Review all Python files in the input directory
-    review_results = review_python_files(INPUT_DIRECTORY)
-
-    # Write the reviews to the output file
-    with open(OUTPUT_FILE, 'w') as output_file:
-        output_file.write(f"<html><head><title>Python Code Reviews</title></head><body>{review_results}</body></html>")
+    # Review all Python files in the input directory, streaming the reviews to the output file
+    with HtmlReportWriter(OUTPUT_FILE, title="Python Code Reviews", style="") as report:
+        review_python_files(INPUT_DIRECTORY, report)
 
     print(f"Review report saved as '{OUTPUT_FILE}'.")
+    print(review_cache.stats())
+    print(usage.summary())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+
+BASELINE_FILE = os.path.join("ignore", "baseline_index.json")
+# String and numeric literals are masked so edits to values keep a finding's fingerprint
+LITERAL_PATTERN = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|\b\d+(?:\.\d+)?\b")
+
+
+def normalize_statement(line):
+    """Lowercases a source line, masks literals and collapses whitespace."""
+    return re.sub(r"\s+", " ", LITERAL_PATTERN.sub("?", line.strip().lower()))
+
+
+def fingerprint_findings(findings, code_content):
+    """Returns [(fingerprint, finding)] for findings on code_content.
+
+    A fingerprint combines the finding's category, the normalized statement on its line and
+    which occurrence of that statement in the file it is, so it survives lines moving, while
+    the model's wording of the finding does not matter.
+    """
+    statements = [normalize_statement(line) for line in code_content.split("\n")]
+    seen = Counter()
+    result = []
+    for finding in sorted(findings, key=lambda f: (f["line"], f["section"], f["identification"])):
+        line = finding["line"]
+        statement = statements[line - 1] if 1 <= line <= len(statements) else ""
+        occurrence = statements[:line - 1].count(statement) if statement else 0
+        key = (finding["section"], statement, occurrence)
+        seen[key] += 1
+        text = "\x1f".join([finding["section"], statement, str(occurrence), str(seen[key])])
+        result.append((hashlib.sha1(text.encode("utf-8")).hexdigest()[:16], finding))
+    return result
+
+
+class BaselineIndex:
+    """Compact JSON index of baseline finding fingerprints per file."""
+
+    def __init__(self, path=BASELINE_FILE):
+        self.path = path
+        self._files = None
+
+    def _load(self):
+        if self._files is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as index_file:
+                    self._files = {name: set(prints) for name, prints in json.load(index_file).items()}
+            except FileNotFoundError:
+                self._files = {}
+        return self._files
+
+    def has(self, filename):
+        return filename in self._load()
+
+    def update(self, filename, fingerprinted):
+        """Replaces the baseline of one file with the given (fingerprint, finding) pairs."""
+        self._load()[filename] = {fingerprint for fingerprint, _ in fingerprinted}
+
+    def new_findings(self, filename, fingerprinted):
+        """Returns the findings whose fingerprints are not in the file's baseline."""
+        baseline = self._load().get(filename, set())
+        return [finding for fingerprint, finding in fingerprinted if fingerprint not in baseline]
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as index_file:
+            json.dump({name: sorted(prints) for name, prints in sorted(self._load().items())}, index_file,
+                      separators=(",", ":"))
@@ -0,0 +1,71 @@
+import re
+
+# Files at or under this estimate are packed together instead of reviewed alone.
+SMALL_FILE_MAX_TOKENS = 1500
+# Input budget for the packed code of one request.
+BATCH_TOKEN_BUDGET = 12000
+# Each file still needs its own review tables inside the 8192 output tokens.
+MAX_FILES_PER_BATCH = 8
+
+FILE_START = "===== FILE: {path} ====="
+FILE_END = "===== END FILE: {path} ====="
+REVIEW_MARKER_PATTERN = re.compile(r"<!--\s*REVIEW:\s*(.+?)\s*-->")
+
+BATCH_INSTRUCTIONS = """The code below contains several independent files. Each file starts with a line
+"===== FILE: <path> =====" and ends with "===== END FILE: <path> =====".
+Review every file separately, following all of the instructions above for each one.
+Start the review of each file with the exact line "<!-- REVIEW: <path> -->" using the path
+from its FILE line, and do not mix findings from different files.
+"""
+
+
+def estimate_tokens(text):
+    """Roughly estimates the token count of text (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+def is_small_file(numbered_code):
+    return estimate_tokens(numbered_code) <= SMALL_FILE_MAX_TOKENS
+
+
+def pack_batches(files, token_budget=BATCH_TOKEN_BUDGET, max_files=MAX_FILES_PER_BATCH):
+    """Packs (file_path, numbered_code) pairs, in order, into batches that fit the token budget."""
+    batches = []
+    current = []
+    current_tokens = 0
+    for file_path, numbered_code in files:
+        tokens = estimate_tokens(numbered_code)
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_files):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append((file_path, numbered_code))
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def build_batch_content(batch, instructions=BATCH_INSTRUCTIONS):
+    """Joins a batch of files into one code block using the delimiter protocol."""
+    parts = [instructions]
+    for file_path, numbered_code in batch:
+        parts.append(FILE_START.format(path=file_path))
+        parts.append(numbered_code)
+        parts.append(FILE_END.format(path=file_path))
+    return '\n'.join(parts)
+
+
+def split_batch_response(response_text, file_paths):
+    """Splits a batched response into {file_path: review}; files the model skipped are left out."""
+    reviews = {}
+    matches = list(REVIEW_MARKER_PATTERN.finditer(response_text))
+    for index, match in enumerate(matches):
+        file_path = match.group(1)
+        if file_path not in file_paths:
+            continue
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(response_text)
+        section = response_text[match.end():end].strip()
+        if section:
+            reviews[file_path] = reviews.get(file_path, "") + section
+    return reviews
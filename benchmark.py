@@ -0,0 +1,196 @@
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import retry
+from batching import build_batch_content, is_small_file, pack_batches, split_batch_response
+from chunking import add_line_numbers, review_in_chunks
+from fake_gemini import FakeGenerativeModel
+from review_cache import ReviewCache, cache_key
+from review_engine import MAX_IN_FLIGHT, collect_files, review_files
+from synthetic_corpus import generate_corpus
+from telemetry import percentile
+
+MODES = ["sequential", "concurrent", "streaming", "chunked", "batched", "cached"]
+GENERATION_CONFIG = {
+    "max_output_tokens": 8192,
+    "temperature": 0.5,
+    "top_p": 0.95,
+}
+# Same size as the instruction block the review scripts send with every file (~2 KB).
+BENCHMARK_PROMPT = ("Analyze the provided code for syntax errors, code bugs, security vulnerabilities, "
+                    "duplicate code and improvement suggestions, and answer in HTML tables.\n") * 14
+
+
+def read_file_content(file_path):
+    with open(file_path, 'r') as file:
+        return file.read()
+
+
+class BenchmarkReviewer:
+    """Review calls against the simulated backend, counting errors like the scripts report them."""
+
+    def __init__(self, model, cache=None, stream=False):
+        self.model = model
+        self.cache = cache
+        self.stream = stream
+        self.errors = 0
+
+    def _call(self, prompt):
+        if not self.stream:
+            return self.model.generate_content(prompt, generation_config=GENERATION_CONFIG).text
+        responses = self.model.generate_content([prompt], generation_config=GENERATION_CONFIG, stream=True)
+        return "".join(response.text for response in responses)
+
+    def review_numbered_code(self, numbered_code):
+        prompt = f"{BENCHMARK_PROMPT}\nThe Code:\n{numbered_code}"
+        try:
+            if self.cache is None:
+                return retry.call_with_retry(self._call, prompt)
+            key = cache_key(numbered_code, BENCHMARK_PROMPT, self.model.model_name, GENERATION_CONFIG)
+            return self.cache.fetch(key, lambda: retry.call_with_retry(self._call, prompt))
+        except Exception as e:
+            self.errors += 1
+            return f"Error generating review: {str(e)}"
+
+    def review_file(self, file_path):
+        return self.review_numbered_code(add_line_numbers(read_file_content(file_path)))
+
+    def review_file_in_chunks(self, file_path):
+        return review_in_chunks(read_file_content(file_path), file_path, self.review_numbered_code)
+
+
+def _run_files(file_paths, review_file, max_in_flight):
+    return {file_path: elapsed for file_path, _, elapsed in review_files(file_paths, review_file, max_in_flight)}
+
+
+def _run_batched(file_paths, reviewer, max_in_flight):
+    latencies = {}
+    small_files = []
+    single_files = []
+    for file_path in file_paths:
+        numbered_code = add_line_numbers(read_file_content(file_path))
+        if is_small_file(numbered_code):
+            small_files.append((file_path, numbered_code))
+        else:
+            single_files.append((file_path, numbered_code))
+
+    def run_batch(batch):
+        start_time = time.time()
+        if len(batch) == 1:
+            reviewer.review_numbered_code(batch[0][1])
+        else:
+            response = reviewer.review_numbered_code(build_batch_content(batch))
+            split_batch_response(response, [file_path for file_path, _ in batch])
+        elapsed = time.time() - start_time
+        return [(file_path, elapsed) for file_path, _ in batch]
+
+    requests = pack_batches(small_files) + [[item] for item in single_files]
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for results in executor.map(run_batch, requests):
+            latencies.update(results)
+    return latencies
+
+
+def run_mode(mode, file_paths, model_options, max_in_flight, cache_dir):
+    """Runs one execution mode over the corpus and returns its throughput and latency figures."""
+    model = FakeGenerativeModel(**model_options)
+    cache = None
+    if mode == "cached":
+        cache = ReviewCache(cache_dir=cache_dir)
+        # Warm the cache first; the measured run is the steady-state nightly case.
+        with contextlib.redirect_stdout(io.StringIO()):
+            _run_files(file_paths, BenchmarkReviewer(model, cache).review_file, max_in_flight)
+        model.calls = 0
+    reviewer = BenchmarkReviewer(model, cache, stream=(mode == "streaming"))
+
+    tracemalloc.start()
+    start_time = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if mode == "sequential":
+            latencies = _run_files(file_paths, reviewer.review_file, 1)
+        elif mode == "chunked":
+            latencies = _run_files(file_paths, reviewer.review_file_in_chunks, max_in_flight)
+        elif mode == "batched":
+            latencies = _run_batched(file_paths, reviewer, max_in_flight)
+        else:
+            latencies = _run_files(file_paths, reviewer.review_file, max_in_flight)
+    elapsed = time.time() - start_time
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    values = list(latencies.values())
+    return {
+        "mode": mode,
+        "files": len(file_paths),
+        "seconds": elapsed,
+        "files_per_sec": len(file_paths) / elapsed if elapsed else 0.0,
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "peak_mb": peak_memory / (1024 * 1024),
+        "calls": model.calls,
+        "errors": reviewer.errors,
+    }
+
+
+def print_results(results, time_scale):
+    print(f"Simulated latencies scaled by {time_scale}; per-file latencies are in scaled seconds.")
+    header = f"{'mode':<11}{'files':>7}{'seconds':>10}{'files/s':>10}{'p50':>9}{'p95':>9}{'p99':>9}{'peak MB':>9}{'calls':>7}{'errors':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['mode']:<11}{r['files']:>7}{r['seconds']:>10.2f}{r['files_per_sec']:>10.1f}"
+              f"{r['p50']:>9.3f}{r['p95']:>9.3f}{r['p99']:>9.3f}{r['peak_mb']:>9.1f}{r['calls']:>7}{r['errors']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the review pipeline against a simulated Gemini backend.")
+    parser.add_argument("--corpus", help="Existing directory to review; a synthetic corpus is generated if omitted.")
+    parser.add_argument("--files", type=int, default=200, help="Number of synthetic files to generate.")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"Comma-separated subset of {', '.join(MODES)}.")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT)
+    parser.add_argument("--time-scale", type=float, default=0.02, help="Multiplier applied to every simulated delay.")
+    parser.add_argument("--ttft", type=float, default=1.5, help="Median simulated time to first token, in seconds.")
+    parser.add_argument("--tokens-per-second", type=float, default=150.0)
+    parser.add_argument("--response-tokens", type=int, default=1200)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls failing with 503.")
+    parser.add_argument("--quota-rate", type=float, default=0.0, help="Share of calls failing with 429.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    retry.BASE_DELAY *= args.time_scale
+    retry.MAX_DELAY *= args.time_scale
+    model_options = {
+        "ttft": args.ttft,
+        "tokens_per_second": args.tokens_per_second,
+        "response_tokens": args.response_tokens,
+        "error_rate": args.error_rate,
+        "quota_rate": args.quota_rate,
+        "time_scale": args.time_scale,
+        "seed": args.seed,
+    }
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        if args.corpus:
+            file_paths = collect_files(args.corpus, ('.py', '.sql'))
+        else:
+            file_paths = generate_corpus(os.path.join(work_dir, "corpus"), args.files, args.seed)
+        results = []
+        for mode in args.modes.split(","):
+            mode = mode.strip()
+            if mode not in MODES:
+                parser.error(f"unknown mode {mode!r}")
+            retry.run_budget = retry.RetryBudget()
+            results.append(run_mode(mode, file_paths, model_options, args.max_in_flight,
+                                    os.path.join(work_dir, f"cache_{mode}")))
+        print_results(results, args.time_scale)
+
+
+if __name__ == "__main__":
+    main()
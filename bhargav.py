@@ -1,7 +1,9 @@
 import os
 import time
-import vertexai
-from vertexai.generative_models import GenerativeModel
+from duplicates import duplicate_findings, duplicate_section_html, find_clones
+from review_cache import cache_from_argv, cache_key
+from telemetry import UsageRecorder
+from vertex_client import LazyModel
 
 GOOGLE_APPLICATION_CREDENTIALS = "service.json"
 PROJECT_ID = "cedar-context-433909-d9"
@@ -9,14 +11,14 @@ LOCATION = "us-central1"
 GENERATIVE_MODEL_NAME = "gemini-1.5-flash-001"
 directory_path = "pythonreview"
 OUTPUT_FILE = "python_review.html"
+# Duplicate Code is found locally across all files and shown after the model's four sections
+DUPLICATE_SECTION_NUMBER = 5
 
 
-# Set Google Cloud credentials and initialize Vertex AI
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = GOOGLE_APPLICATION_CREDENTIALS
-vertexai.init(project=PROJECT_ID, location=LOCATION)
- 
-# Initialize the Generative Model
-model = GenerativeModel(GENERATIVE_MODEL_NAME)
+# Vertex AI is initialized on the first model call, so cached runs never load the SDK
+model = LazyModel(GENERATIVE_MODEL_NAME, PROJECT_ID, LOCATION, GOOGLE_APPLICATION_CREDENTIALS)
+review_cache = cache_from_argv()
+usage = UsageRecorder()
  
 def error_refer(code_py):
     lines = code_py.split('\n')
@@ -49,13 +51,7 @@ Please analyze the provided code snippet and provide the following information:
     - ** Note **: If no security vulnerabilities are found, simply state "No Security Vulnerabilities Found."
     - ** highlight the word Security Vulnerabilities
  
-4. ** Duplicate Code :**
-    - ** Identification **: Highlight sections of the code lines that are duplicated.
-    - ** Suggestion **: Provide recommendations without rewriting the entire code.
-    - ** Note **: If no code duplicate code is found, simply state "No duplicate code in this file."
-    - ** highlight the word Duplicate Code
- 
-5. ** Code Improvement Suggestions :**
+4. ** Code Improvement Suggestions :**
     - ** Identification **: Highlight sections of the code that can be improved.
         - This could include:
         - Unnecessary complexity
@@ -65,9 +61,9 @@ Please analyze the provided code snippet and provide the following information:
     - ** Note **: If no code improvement suggestions are found, simply state "No Code Improvement Suggestions Found."
     - ** highlight the word Code Improvement Suggestions
 
-6. ** Don't write any kind of code or code snippet in the output: **
+5. ** Don't write any kind of code or code snippet in the output: **
 
-7.Generate the output in a purely HTML format so that the file can be opened and displayed as a proper web page.
+6.Generate the output in a purely HTML format so that the file can be opened and displayed as a proper web page.
   - Maintain a consistent format for all review responses.
   - Each file's review should be in a distinct section, easily identifiable with proper headings and spacing.
   - Table Format: Structure the content in tables with the following specifications:
@@ -79,26 +75,30 @@ Please analyze the provided code snippet and provide the following information:
 
     """
  
+    generation_config = {
+        "max_output_tokens": 8192,
+        "temperature": 0.2,
+        "top_p": 0.95,
+    }
+    key = cache_key(code_py, prompt, GENERATIVE_MODEL_NAME, generation_config)
+
     try:
-        response = model.generate_content(
-            prompt,
-            generation_config={
-                "max_output_tokens": 8192,
-                "temperature": 0.2,
-                "top_p": 0.95,
-            }
+        review_text = review_cache.fetch(
+            key,
+            lambda: usage.call(filename, GENERATIVE_MODEL_NAME, model.generate_content, prompt, generation_config=generation_config).text,
         )
         end_time = time.time()
         print(f"total time taken for {filename}:  {round(end_time - start_time, 3)} seconds")
-        return response.text
+        return review_text
     except Exception as e:
         end_time = time.time()
         print(f"total time taken for {filename}:  {round(end_time - start_time, 3)} seconds")
         return f"Error generating review: {str(e)}"
      
-def main(content,filename,file_path):
+def main(content,filename,file_path,duplicates=()):
     numbered_code = error_refer(content)    
     review = generate_review(numbered_code,filename)
+    review += duplicate_section_html(duplicates, DUPLICATE_SECTION_NUMBER)
     filename=f"{filename}.html"
     # Write the review to the output file
     with open(OUTPUT_FILE, 'a') as output_file:
@@ -122,19 +122,20 @@ def read_file_content(file_path):
 
 def read_files_in_directory(directory_path):
     """Reads all Python files in the given directory."""
-    # List to store content of each file
-    
+    file_paths = [os.path.join(directory_path, filename) for filename in os.listdir(directory_path) if filename.endswith('.py')]
+    # Duplicate code is detected locally across all files before any model call
+    duplicates = duplicate_findings(find_clones(file_paths))
     
-    # Loop through each file in the directory
-    for filename in os.listdir(directory_path):
-        # Check if the file is a Python file
-        if filename.endswith('.py'):
-            file_path = os.path.join(directory_path, filename)
-            content = read_file_content(file_path)
-            
-            main(content,filename,file_path)
+    # Loop through each Python file in the directory
+    for file_path in file_paths:
+        filename = os.path.basename(file_path)
+        content = read_file_content(file_path)
+        
+        main(content,filename,file_path,duplicates[file_path])
            
 
 
 
-all_files_content = read_files_in_directory(directory_path)
+if __name__ == "__main__":
+    all_files_content = read_files_in_directory(directory_path)
+    print(usage.summary())
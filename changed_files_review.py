@@ -1,14 +1,28 @@
 
 import os
 import subprocess
-import vertexai
 import time
-from vertexai.generative_models import GenerativeModel
-import vertexai.preview.generative_models as generative_models
-
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "credentials_file.json"
-
-vertexai.init(project="cedar-context-433909-d9", location="us-west1")
+from batching import build_batch_content, is_small_file, pack_batches, split_batch_response
+from diff_hunks import diff_excerpt
+from duplicates import duplicate_findings, duplicate_section_html, find_clones
+from findings import (
+    STRUCTURED_BATCH_INSTRUCTIONS,
+    STRUCTURED_INSTRUCTIONS,
+    group_findings_by_file,
+    parse_findings,
+    render_findings_html,
+    structured_generation_config,
+)
+from prompt_cache import build_review_model
+from report_writer import HtmlReportWriter
+from review_engine import collect_files
+from telemetry import UsageRecorder, collect_stream
+from vertex_client import LazyModel, block_only_high_safety_settings
+
+GOOGLE_APPLICATION_CREDENTIALS = "credentials_file.json"
+PROJECT_ID = "cedar-context-433909-d9"
+LOCATION = "us-west1"
+GENERATIVE_MODEL_NAME = "gemini-1.5-flash-001"
 
 generation_config = {
     "max_output_tokens": 8192,
@@ -16,16 +30,18 @@ generation_config = {
     "top_p": 0.95,
 }
 
-safety_settings = {
-    generative_models.HarmCategory.HARM_CATEGORY_HATE_SPEECH: generative_models.HarmBlockThreshold.BLOCK_ONLY_HIGH,
-    generative_models.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: generative_models.HarmBlockThreshold.BLOCK_ONLY_HIGH,
-    generative_models.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: generative_models.HarmBlockThreshold.BLOCK_ONLY_HIGH,
-    generative_models.HarmCategory.HARM_CATEGORY_HARASSMENT: generative_models.HarmBlockThreshold.BLOCK_ONLY_HIGH,
-}
-
-generative_model = GenerativeModel("gemini-1.5-flash-001")
-
 OUTPUT_FILE = "review_summary.html"
+# Review only the changed hunks (plus DIFF_CONTEXT_LINES around them) instead of whole files
+REVIEW_DIFF_HUNKS_ONLY = True
+DIFF_CONTEXT_LINES = 10
+report = HtmlReportWriter(OUTPUT_FILE, title="Python Code Review Summary", append=True)
+# Pack small changed files into shared requests (see batching.py)
+BATCH_SMALL_FILES = True
+# Ask for compact JSON findings and render the HTML tables locally (see findings.py)
+STRUCTURED_FINDINGS = True
+# Duplicate Code is found locally across the whole directory, not by the model
+DUPLICATE_EXTENSIONS = ('.py', '.sql')
+DUPLICATE_SECTION_NUMBER = 5
 
 
 def read_file_content(file_path):
@@ -46,66 +62,83 @@ def format_time(seconds):
     return f"{seconds:.2f} seconds"
 
 
-def append_to_output_file(content, file_name, file_path, time_taken):
+def append_to_output_file(content, file_name, file_path, time_taken, usage_label=None):
     """Append content to the output file as HTML with proper formatting."""
-    if not os.path.exists(OUTPUT_FILE):
-        # If the file doesn't exist, create it with the initial HTML structure
-        with open(OUTPUT_FILE, "w", encoding="utf-8") as output_file:
-            output_file.write(f"""
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Python Code Review Summary</title>
-            <style>
-                body {{ font-family: Arial, sans-serif; margin: 20px; }}
-                h1 {{ color: #34495E; text-align: center; }}
-                pre {{ }}
-            </style>
-        </head>
-        <body>
-            <h1>Python Code Review Summary</h1>
-        </body>
-        </html>
-        """)
-    # Append the formatted review to the file
-    with open(OUTPUT_FILE, "a", encoding="utf-8") as output_file:
-        output_file.write(f"""
+    # Batched files share the streaming metrics of their batch request
+    streaming = usage.stream_summary(usage_label or file_path)
+    streaming_line = f"<br>Streaming: {streaming}" if streaming else ""
+    # The writer keeps the report well-formed and adds to the previous run's report
+    report.write_section(f"""
              <div style="margin-bottom: 20px; border: 1px solid #ccc; padding: 15px; border-radius: 8px; background-color: #f9f9f9;">
                     <h2 style="color: #2C3E50;">Review for {file_name}</h2>
                     <p style="font-style: italic; color: #000000;">File Path: {file_path}</p>
+                    <p style="color: #000000;">Time Taken for Review: {format_time(time_taken)}{streaming_line}</p>
                     <h3 style="color: #2980B9;">Review:</h3>
                     {content}
                 </div>
         """)
 
 
-def generate_content_for_review(code_content):
+def stream_response(contents, model=None, config=None):
+    """Streams the model response for the given contents and returns it with the full text collected."""
+    responses = (model or generative_model).generate_content(
+        contents,
+        generation_config=config or generation_config,
+        safety_settings=block_only_high_safety_settings(),
+        stream=True,
+    )
+    return collect_stream(responses)
+
+
+def generate_content_for_review(code_content, label="review request"):
     """Generates a detailed review of the provided code snippet."""
     response_text = ""
     try:
-        responses = generative_model.generate_content(
-            [prompt(code_content)],
-            generation_config=generation_config,
-            safety_settings=safety_settings,
-            stream=True,
-        )
-        for response in responses:
-            response_text += response.text
+        response_text = usage.call(label, GENERATIVE_MODEL_NAME, stream_response, [prompt(code_content)]).text
 
     except ValueError as e:
         if "SAFETY" in str(e):
             print(f"WARNING: Generated content blocked by safety filters: {e}")
         else:
-            raise e
+            response_text = f"Error generating review: {str(e)}"
+    except Exception as e:
+        # Retries or the run budget are used up; only this file needs re-running
+        print(f"Error generating review for {label}: {e}")
+        response_text = f"Error generating review: {str(e)}"
 
     return response_text
 
 
-def prompt(code_content):
-    """Creates a prompt to analyze code for various issues."""
-    return f"""  you are an intelligent code expert.   
+def generate_findings(code_content, label="review request"):
+    """Asks for JSON findings matching findings.RESPONSE_SCHEMA and returns them as a list of dicts."""
+    from vertexai.generative_models import GenerationConfig
+
+    response = usage.call(
+        label,
+        GENERATIVE_MODEL_NAME,
+        stream_response,
+        [prompt(code_content)],
+        model=structured_model,
+        config=GenerationConfig(**structured_generation_config(generation_config)),
+    )
+    return parse_findings(response.text)
+
+
+def review_code(code_content, label="review request", duplicates=()):
+    """Reviews code and returns the review HTML, rendering structured findings locally when enabled."""
+    if STRUCTURED_FINDINGS:
+        try:
+            return render_findings_html(generate_findings(code_content, label) + list(duplicates))
+        except ValueError as e:
+            print(f"WARNING: Structured review failed ({e}); falling back to an HTML review.")
+        except Exception as e:
+            print(f"Error generating review for {label}: {e}")
+            return f"Error generating review: {str(e)}"
+    return generate_content_for_review(code_content, label) + duplicate_section_html(duplicates, DUPLICATE_SECTION_NUMBER)
+
+
+# Static review instructions, sent once as the system instruction instead of with every file
+REVIEW_INSTRUCTIONS = """  you are an intelligent code expert.   
 Please analyze the provided code snippet and provide the following information:
 1. Syntax Errors:
     - Identification: Identify the exact error-causing line numbers and provide the exact syntax errors.
@@ -140,16 +173,7 @@ Please analyze the provided code snippet and provide the following information:
     - Note: If no security vulnerabilities are found, generate a table with "No Security Vulnerabilities Found" in normal font (Times New Roman).
     -  Note: If no security vulnerabilities are found, generate a table with "No Security Vulnerabilities Found" in normal font (Times New Roman).
  
-4. Duplicate Code:
-    -  Identification: Highlight sections of the code lines that are duplicated.
-    -  Suggestion: Provide recommendations without rewriting the entire code.
-    - Criticality: Assign a criticality level to the duplicate code:
-        - Low: A small section of duplicated code that has minimal impact.
-        - Medium: Duplicated code that affects readability and increases maintenance effort.
-        - High: Extensive duplication that significantly complicates debugging and future changes.
-    -  Note: If no duplicate code is found, generate a table with "No duplicate code in this file" in normal font (Times New Roman).
- 
-5.  Code Improvement Suggestions :
+4.  Code Improvement Suggestions :
     -  Identification : Highlight sections of the code that can be improved.
         - This could include:
         - Unnecessary complexity
@@ -162,9 +186,9 @@ Please analyze the provided code snippet and provide the following information:
         - High: Major improvements that significantly affect efficiency, maintainability, or scalability.
     -  Note: If no code improvement suggestions are found, generate a table with "No Code Improvement Suggestions Found" in normal font (Times New Roman).
 
-6.  Don't write any kind of code or code snippet in the output: 
+5.  Don't write any kind of code or code snippet in the output: 
 
-7. Generate the output in purely HTML format with consistent table formatting for each section:
+6. Generate the output in purely HTML format with consistent table formatting for each section:
     - set response table width to 100%
     - strictly use only the 100% of the page not more than that
     - strictly do not give any headings for review response of file
@@ -178,23 +202,92 @@ Please analyze the provided code snippet and provide the following information:
         - ensure all headings, section headings, content, file names, and paths should be left-aligned and text color is black.
         - make sure that line number is present in present in identification column itself(no more column containing line numbers)
         - ensure that Identification, Explanation, Fix, and criticality are the only column names for Syntax Errors, Code Bugs, Security Vulnerabilities sections and
-          Identification, Suggestions, and Criticality are the only column names for duplicate code and code improvement suggestions
+          Identification, Suggestions, and Criticality are the only column names for code improvement suggestions
            - strictly no other columns are allowed.
  
-8. Headings like "Syntax Errors", "Code Bugs", "Security Vulnerabilities", "Duplicate Code", and "Code Improvement Suggestions" must be bold and numbered.
+7. Headings like "Syntax Errors", "Code Bugs", "Security Vulnerabilities", and "Code Improvement Suggestions" must be bold and numbered.
     - Ensure the content, such as "No Syntax Errors Found", is in normal font (Times New Roman).
     - Maintain consistent font styles for all headings and content.
  
-9. Page Layout:
+8. Page Layout:
    - The page width must be constrained to 100%, ensuring it does not exceed this width.
    - Use "Overflow-wrap: break-word;" to handle long text gracefully without exceeding the table width.
    - Ensure all tables fit within this page width, with no overflow beyond the page boundaries.
+"""
 
-The code:
+# Vertex AI is initialized and the models are built on the first model call
+generative_model = LazyModel(
+    GENERATIVE_MODEL_NAME, PROJECT_ID, LOCATION, GOOGLE_APPLICATION_CREDENTIALS,
+    build=lambda: build_review_model(GENERATIVE_MODEL_NAME, REVIEW_INSTRUCTIONS),
+)
+structured_model = LazyModel(
+    GENERATIVE_MODEL_NAME, PROJECT_ID, LOCATION, GOOGLE_APPLICATION_CREDENTIALS,
+    build=lambda: build_review_model(GENERATIVE_MODEL_NAME, STRUCTURED_INSTRUCTIONS),
+)
+# Prints prompt/output tokens per request and writes them to review_usage.jsonl
+usage = UsageRecorder(verbose=True)
+
+
+def prompt(code_content):
+    """Creates the per-file part of the prompt; the instructions travel as the system instruction."""
+    return f"""The code:
 {code_content}
 """
 
 
+def review_single_file(file_path, numbered_code, duplicates):
+    """Reviews one file on its own and appends the review to the output file."""
+    print(f"\n\nReviewing file: {file_path}")
+    start_time = time.time()
+
+    response_text = review_code(numbered_code, file_path, duplicates[os.path.normpath(file_path)])
+    time_taken = time.time() - start_time
+
+    # Append the review response to the output file
+    if response_text.strip():
+        append_to_output_file(response_text, os.path.basename(file_path), file_path, time_taken)
+    else:
+        append_to_output_file("No response received from the AI model.", os.path.basename(file_path), file_path, time_taken)
+
+
+def review_batch(batch, duplicates):
+    """Reviews several small files in one request, falling back to single reviews for files left unanswered."""
+    file_paths = [file_path for file_path, _ in batch]
+    print(f"\n\nReviewing {len(batch)} files in one request: {', '.join(file_paths)}")
+    start_time = time.time()
+    label = f"batch of {len(batch)} files starting with {file_paths[0]}"
+
+    if STRUCTURED_FINDINGS:
+        try:
+            findings = generate_findings(build_batch_content(batch, STRUCTURED_BATCH_INSTRUCTIONS), label)
+            grouped, unattributed = group_findings_by_file(findings, file_paths)
+            if unattributed:
+                # They may belong to any file without findings, so those are not reported as clean
+                print(f"WARNING: {len(unattributed)} findings name no file of the batch; "
+                      "files without findings are reviewed one by one.")
+            reviews = {
+                file_path: render_findings_html(grouped[file_path] + duplicates[os.path.normpath(file_path)])
+                for file_path in file_paths
+                if grouped[file_path] or not unattributed
+            }
+        except Exception as e:
+            print(f"WARNING: Structured batch review failed ({e}); reviewing files one by one.")
+            reviews = {}
+    else:
+        response_text = generate_content_for_review(build_batch_content(batch), label)
+        reviews = {
+            file_path: review + duplicate_section_html(duplicates[os.path.normpath(file_path)], DUPLICATE_SECTION_NUMBER)
+            for file_path, review in split_batch_response(response_text, file_paths).items()
+        }
+    time_taken = (time.time() - start_time) / len(batch)
+
+    for file_path, numbered_code in batch:
+        if file_path in reviews:
+            append_to_output_file(reviews[file_path], os.path.basename(file_path), file_path, time_taken, label)
+        else:
+            review_single_file(file_path, numbered_code, duplicates)
+
+
 def process_changed_files(directory_path):
     """Processes each changed file in the directory and generates a review."""
     # Get the list of changed files using git diff
@@ -204,33 +297,45 @@ def process_changed_files(directory_path):
     # Filter changed files that are in the specified directory
     code_files = [file for file in changed_files if file.startswith(directory_path)]
 
+    # Changed files are compared with the indexed fingerprints of the whole directory; only
+    # files edited since the last run are tokenized again
+    clones = find_clones(collect_files(directory_path, DUPLICATE_EXTENSIONS), changed=code_files)
+    duplicates = duplicate_findings(
+        dict(clone, file=os.path.normpath(clone["file"]), other_file=os.path.normpath(clone["other_file"]))
+        for clone in clones
+    )
+
+    small_files = []
     for file_path in code_files:
         if os.path.isfile(file_path):
             # Read and review the changed file
             code_content = read_file_content(file_path)
-            code_content_with_line_numbers = add_line_numbers(code_content)
-            print(f"\n\nReviewing file: {file_path}")
-
-            start_time = time.time()
-
-            response_text = generate_content_for_review(code_content_with_line_numbers)
-            time_taken = time.time() - start_time
-
-            # Append the review response to the output file
-            if response_text.strip():
-                append_to_output_file(response_text, os.path.basename(file_path), file_path, time_taken)
+            code_content_with_line_numbers = None
+            if REVIEW_DIFF_HUNKS_ONLY:
+                # Send only the changed hunks plus context; line numbers stay those of the file
+                code_content_with_line_numbers = diff_excerpt(file_path, code_content, DIFF_CONTEXT_LINES)
+            if code_content_with_line_numbers is None:
+                code_content_with_line_numbers = add_line_numbers(code_content)
+            if BATCH_SMALL_FILES and is_small_file(code_content_with_line_numbers):
+                small_files.append((file_path, code_content_with_line_numbers))
             else:
-                append_to_output_file("No response received from the AI model.", os.path.basename(file_path), file_path, time_taken)
+                review_single_file(file_path, code_content_with_line_numbers, duplicates)
         else:
             print(f"{file_path} does not exist or was renamed. Skipping...")
 
+    # Small files share requests so the instruction prompt is sent once per batch
+    for batch in pack_batches(small_files):
+        if len(batch) == 1:
+            review_single_file(*batch[0], duplicates)
+        else:
+            review_batch(batch, duplicates)
 
-def main():
-    # Define the directory path to process files
-    python_dir = "folder-1"
 
+def main(python_dir="folder-1"):
     # Process changed files and generate reviews
     process_changed_files(python_dir)
+    report.close()
+    print(usage.summary())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,160 @@
+import ast
+from concurrent.futures import ThreadPoolExecutor
+
+from findings import MODEL_SECTIONS, render_findings_html
+from run_journal import ERROR_MARKER
+
+# Files longer than this are split so the review fits in max_output_tokens.
+MAX_CHUNK_LINES = 600
+# Lines repeated from the end of the previous chunk so the model keeps some context.
+OVERLAP_LINES = 20
+# Chunks of one file reviewed at once; their model calls still share review_engine.MAX_IN_FLIGHT
+MAX_CHUNKS_IN_FLIGHT = 4
+
+
+def add_line_numbers(code_content, start_line=1):
+    """Adds line numbers to code content, counting from start_line."""
+    lines = code_content.split('\n')
+    numbered_lines = [f"Line {i + start_line}: {line}" for i, line in enumerate(lines)]
+    return '\n'.join(numbered_lines)
+
+
+def python_boundaries(code_content):
+    """Returns the 1-based lines where top-level statements, defs and classes start."""
+    tree = ast.parse(code_content)
+    boundaries = []
+    for node in tree.body:
+        decorators = getattr(node, "decorator_list", [])
+        boundaries.append(min([node.lineno] + [d.lineno for d in decorators]))
+    return boundaries
+
+
+def sql_boundaries(code_content):
+    """Returns the 1-based lines where SQL statements start, ignoring ';' in strings and comments."""
+    boundaries = [1]
+    quote = None
+    block_comment = False
+    line_number = 1
+    i = 0
+    length = len(code_content)
+    while i < length:
+        char = code_content[i]
+        pair = code_content[i:i + 2]
+        if char == '\n':
+            line_number += 1
+        elif block_comment:
+            if pair == '*/':
+                block_comment = False
+                i += 1
+        elif quote:
+            if char == quote:
+                quote = None
+        elif pair == '--':
+            newline = code_content.find('\n', i)
+            i = length if newline == -1 else newline
+            continue
+        elif pair == '/*':
+            block_comment = True
+            i += 1
+        elif char in ("'", '"', '`'):
+            quote = char
+        elif char == ';':
+            boundaries.append(line_number + 1)
+        i += 1
+    return boundaries
+
+
+def _boundaries(code_content, file_type):
+    if file_type.endswith("py"):
+        try:
+            return python_boundaries(code_content)
+        except SyntaxError:
+            return []
+    if file_type.endswith("sql"):
+        return sql_boundaries(code_content)
+    return []
+
+
+def chunk_code(code_content, file_type, max_lines=MAX_CHUNK_LINES, overlap=OVERLAP_LINES):
+    """Splits code on statement boundaries into (start_line, end_line, text) chunks of at most max_lines."""
+    lines = code_content.split('\n')
+    total = len(lines)
+    if total <= max_lines:
+        return [(1, total, code_content)]
+
+    # Cut points are boundary lines; a segment that is still too long is cut every max_lines.
+    cut_points = sorted({b for b in _boundaries(code_content, file_type) if 1 < b <= total})
+    chunks = []
+    start = 1
+    while start <= total:
+        limit = min(start + max_lines - 1, total)
+        end = limit
+        if limit < total:
+            candidates = [b - 1 for b in cut_points if start < b <= limit + 1]
+            if candidates:
+                end = candidates[-1]
+        context_start = max(1, start - overlap) if chunks else start
+        chunks.append((context_start, end, '\n'.join(lines[context_start - 1:end])))
+        start = end + 1
+    return chunks
+
+
+def merge_chunk_findings(chunks, chunk_findings):
+    """Merges per-chunk findings into one list.
+
+    A chunk's findings on the overlap lines it repeats from the previous chunk are dropped, since
+    that chunk already reported them; findings repeated word for word on the same line are kept once.
+    """
+    merged = []
+    seen = set()
+    own_start = 1
+    for (_, end_line, _), findings in zip(chunks, chunk_findings):
+        for finding in findings:
+            if 0 < finding["line"] < own_start:
+                continue
+            key = (finding["section"], finding["line"], finding["identification"].lower())
+            if key not in seen:
+                seen.add(key)
+                merged.append(finding)
+        own_start = end_line + 1
+    return merged
+
+
+def review_in_chunks(code_content, file_type, review_numbered_code, review_numbered_findings=None,
+                     sections=MODEL_SECTIONS, start=1, max_in_flight=MAX_CHUNKS_IN_FLIGHT):
+    """Reviews a file chunk by chunk in parallel and merges the results into one review.
+
+    A file that fits in one chunk is reviewed with review_numbered_code. Longer files are reviewed
+    with review_numbered_findings (numbered code -> findings), and the merged findings are rendered
+    as one set of numbered section tables starting at start. Without review_numbered_findings the
+    chunk reviews are only concatenated in line order.
+    """
+    chunks = chunk_code(code_content, file_type)
+    numbered_chunks = [add_line_numbers(text, start_line) for start_line, _, text in chunks]
+    if len(numbered_chunks) == 1:
+        return review_numbered_code(numbered_chunks[0])
+
+    if review_numbered_findings is None:
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            reviews = list(executor.map(review_numbered_code, numbered_chunks))
+        return '\n'.join(
+            f"<!-- Lines {start_line}-{end_line} -->\n{review}"
+            for (start_line, end_line, _), review in zip(chunks, reviews)
+        )
+
+    def review_chunk(numbered_code):
+        try:
+            return review_numbered_findings(numbered_code), None
+        except Exception as e:
+            return [], str(e)
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        results = list(executor.map(review_chunk, numbered_chunks))
+    merged = merge_chunk_findings(chunks, [findings for findings, _ in results])
+    errors = [
+        # Written with the journal's marker so a partly failed file is journaled as failed and retried
+        f"<p>{ERROR_MARKER} lines {start_line}-{end_line}: {error}</p>"
+        for (start_line, end_line, _), (_, error) in zip(chunks, results)
+        if error
+    ]
+    return render_findings_html(merged, sections=sections, start=start) + "".join(errors)
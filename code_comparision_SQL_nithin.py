@@ -1,7 +1,9 @@
 import os
 import time
-import vertexai
-from vertexai.generative_models import GenerativeModel
+from baseline import BaselineIndex, fingerprint_findings
+from findings import parse_findings, render_findings_html, structured_generation_config
+from telemetry import UsageRecorder
+from vertex_client import LazyModel
 
 GOOGLE_APPLICATION_CREDENTIALS = "service.json"
 PROJECT_ID = "cedar-context-433909-d9"
@@ -9,14 +11,14 @@ LOCATION = "us-central1"
 GENERATIVE_MODEL_NAME = "gemini-1.5-flash-001"
 
 OUTPUT_FILE = "review01.html"
+DIRECTORY_PATH = r"C:\taskgcp\SQL_files5"
 string=""
  
-# Set Google Cloud credentials and initialize Vertex AI
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = GOOGLE_APPLICATION_CREDENTIALS
-vertexai.init(project=PROJECT_ID, location=LOCATION)
- 
-# Initialize the Generative Model
-model = GenerativeModel(GENERATIVE_MODEL_NAME)
+# Vertex AI is initialized on the first review request, not while the script waits for the mode prompt
+model = LazyModel(GENERATIVE_MODEL_NAME, PROJECT_ID, LOCATION, GOOGLE_APPLICATION_CREDENTIALS)
+usage = UsageRecorder()
+# Fingerprints of the errors saved by mode 2; mode 3 diffs against them locally
+baseline = BaselineIndex()
 
 
 def error_refer(code_py):
@@ -25,61 +27,43 @@ def error_refer(code_py):
     return '\n'.join(numbered_lines)
  
 def generate_review(code_py,filename):
+    """Returns the file's syntax errors as findings (see findings.RESPONSE_SCHEMA), or None on failure.
+
+    Temperature 0 keeps the findings of an unchanged file stable between the baseline and later runs.
+    """
+    from vertexai.generative_models import GenerationConfig
+
     start_time = time.time()
     prompt = f"""
-    hi vertexai you are an expert in sql. Please review the following  code and identify  syntax  errors:
-    -I do not want my enrite code to display again ,i  want only the  syntax errors
-    - Syntax Errors (highlight with **1. Syntax Error:**)
-    - please give me only the syntax errors i do'nt want any extra information more than syntax error in a single line 
-    - i thing you got me
+    You are an expert in sql. Please review the following code and identify only its syntax errors.
+    - Report every syntax error as a finding in the section "Syntax Errors".
+    - Use the line number from the "Line N:" prefix of the erroneous line.
+    - Keep the identification to a single line; do not repeat the code.
+    - If there are no syntax errors, return an empty list.
     -The code to review:
         {code_py}
     """
  
     try:
-        response = model.generate_content(
+        response = usage.call(
+            filename,
+            GENERATIVE_MODEL_NAME,
+            model.generate_content,
             prompt,
-            generation_config={
+            generation_config=GenerationConfig(**structured_generation_config({
                 "max_output_tokens": 8192,
-                "temperature": 0.5,
+                "temperature": 0,
                 "top_p": 0.95,
-            }
+            }))
         )
-        end_time = time.time()
-        print(f"Total time taken for {filename}: {round(end_time - start_time, 3)} seconds")
-        return response.text
+        return [finding for finding in parse_findings(response.text) if finding["section"] == "Syntax Errors"]
     except Exception as e:
+        print(f"Error generating review for {filename}: {str(e)}")
+        return None
+    finally:
         end_time = time.time()
-        
-
         print(f"Total time taken for {filename}: {round(end_time - start_time, 3)} seconds")
 
-        return f"Error generating review: {str(e)}"
-
-def generate_review_comparision(code_py1,code_py2):
-    prompt = f"""
-Compare the sql error files {code_py1} and {code_py2}.
-
-- Only show the  errors that are **new** in {code_py1} and not present in {code_py2}.
-- Ignore any identical errors or content that appears same  in both files.
-- Do not include any extra information other than  the new errors in {code_py1}.
-- just show only new errors and remove all the extra information
-
-"""
- 
-    try:
-        response = model.generate_content(
-            prompt,
-            generation_config={
-                "max_output_tokens": 8192,
-                "temperature": 0.2,
-                "top_p": 0.95,
-            }
-        )
-        return response.text
-    except Exception as e:
-        return f"Error generating review: {str(e)}"
-
 def generate_review_html(code_py,filename):
     start_time = time.time()
     prompt = f"""
@@ -147,7 +131,10 @@ Please analyze the provided code snippet and provide the following information:
    """
  
     try:
-        response = model.generate_content(
+        response = usage.call(
+            filename,
+            GENERATIVE_MODEL_NAME,
+            model.generate_content,
             prompt,
             generation_config={
                 "max_output_tokens": 8192,
@@ -212,17 +199,18 @@ def read_files_in_directory(directory_path):
             file=main(content,filename)
             if a=="1":
                 writefile(file,filename,file_path)
+            elif file is None:
+                print(f"Skipping {filename}: its syntax errors could not be generated.")
             elif a=="2":
-                
-                writefilebyfile(file,filename)
+                baseline.update(filename, fingerprint_findings(file, content))
             elif a=="3":
-                file_path=f"ignore/{filename}_ignore.txt"
-                code_py1=read_file_content(file_path)
+                if not baseline.has(filename):
+                    print(f"No baseline saved for {filename}; all of its errors are reported as new.")
+                new_errors = baseline.new_findings(filename, fingerprint_findings(file, content))
+                writefile(render_findings_html(new_errors, sections=["Syntax Errors"]),filename,file_path)
 
-                newreview=generate_review_comparision(file,code_py1)
-                
-                writefile(newreview,filename,file_path)
-                 
+    if a=="2":
+        baseline.save()
 
             
     
@@ -245,29 +233,14 @@ def writefile(review,filename,file_path):
         """)
 
 
-def writefilebyfile(review,filename):
-
-    ignorefile = f"ignore\{filename}_ignore.txt"
-    with open(ignorefile, 'w') as output_file:
-    # Write a heading
-                
-                output_file.write(review)
-                
-
-a=input("hello ,i am vertex AI. if this is your 1st run press 1 else 2 else 3  :  ")
-if a=="1":
-    directory_path = r"C:\taskgcp\SQL_files5"
+def run(directory_path=DIRECTORY_PATH, mode=None):
+    """Runs one pass: 1 writes the HTML review, 2 saves the baseline errors, 3 reports only new errors."""
+    global a
+    a = mode if mode is not None else input("hello ,i am vertex AI. if this is your 1st run press 1 else 2 else 3  :  ")
+    if a in ("1", "2", "3"):
+        read_files_in_directory(directory_path)
+    print(usage.summary())
 
-    read_files_in_directory(directory_path)
 
-    
-elif a=="2":
-
-    directory_path = r"C:\taskgcp\SQL_files5"
-    read_files_in_directory(directory_path)
-
-elif a=="3":   
-     
-    directory_path = r"C:\taskgcp\SQL_files5"
-    read_files_in_directory(directory_path)
-     
\ No newline at end of file
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,68 @@
+import re
+import subprocess
+
+from chunking import add_line_numbers
+
+DIFF_CONTEXT_LINES = 10
+HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+EXCERPT_NOTE = """Only the changed regions of this file are shown, each with up to {context} lines of surrounding context.
+Line numbers are the real line numbers in the file; lines marked "..." were left out.
+Review only the code shown and refer to the line numbers exactly as given.
+"""
+
+
+def changed_line_ranges(file_path, diff_range="HEAD^..HEAD"):
+    """Returns the (first, last) line ranges of the new file touched by the commit range."""
+    result = subprocess.run(
+        ['git', 'diff', '--unified=0', '--no-color', diff_range, '--', file_path],
+        capture_output=True,
+        text=True,
+    )
+    ranges = []
+    for line in result.stdout.splitlines():
+        match = HUNK_HEADER.match(line)
+        if not match:
+            continue
+        start = int(match.group(1))
+        count = 1 if match.group(2) is None else int(match.group(2))
+        # A pure deletion has count 0; keep the line it happened after as the anchor.
+        ranges.append((start, start + max(count, 1) - 1))
+    return ranges
+
+
+def expand_ranges(ranges, context_lines, total_lines):
+    """Adds context around each range, clamps to the file and merges overlapping ranges."""
+    merged = []
+    for first, last in sorted(ranges):
+        first = max(1, first - context_lines)
+        last = min(total_lines, last + context_lines)
+        if first > last:
+            continue
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def numbered_excerpt(code_content, ranges):
+    """Builds line-numbered excerpts of the given ranges, keeping the file's real line numbers."""
+    lines = code_content.split('\n')
+    parts = []
+    for first, last in ranges:
+        if parts or first > 1:
+            parts.append("...")
+        parts.append(add_line_numbers('\n'.join(lines[first - 1:last]), first))
+    if ranges and ranges[-1][1] < len(lines):
+        parts.append("...")
+    return '\n'.join(parts)
+
+
+def diff_excerpt(file_path, code_content, context_lines=DIFF_CONTEXT_LINES, diff_range="HEAD^..HEAD"):
+    """Returns the changed hunks of a file with context as numbered code, or None if git shows no hunks."""
+    total_lines = len(code_content.split('\n'))
+    ranges = expand_ranges(changed_line_ranges(file_path, diff_range), context_lines, total_lines)
+    if not ranges:
+        return None
+    return EXCERPT_NOTE.format(context=context_lines) + numbered_excerpt(code_content, ranges)
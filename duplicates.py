@@ -0,0 +1,382 @@
+import bisect
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import zlib
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+from findings import render_findings_html
+from review_cache import CACHE_DIR
+from syntax_check import MIN_FILES_FOR_POOL, PRE_PASS_WORKERS
+
+# A clone is reported when at least MIN_CLONE_TOKENS tokens match; winnowing guarantees that any
+# match of SHINGLE_TOKENS + WINDOW - 1 tokens shares a fingerprint.
+SHINGLE_TOKENS = 20
+WINDOW = 10
+MIN_CLONE_TOKENS = 40
+# Fingerprints found in more places than this are boilerplate (imports, config dicts) and skipped
+MAX_OCCURRENCES = 20
+
+# Fingerprints are kept between runs, so a run only tokenizes files that are new or edited
+FINGERPRINT_DB = os.path.join(CACHE_DIR, "fingerprints.sqlite3")
+# Bump when tokenizing or hashing changes; tuple hashes are only stable within one Python version
+FINGERPRINT_VERSION = 2
+SCHEMA_VERSION = FINGERPRINT_VERSION * 10000 + sys.version_info[0] * 100 + sys.version_info[1]
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file_id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    content_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    hash INTEGER NOT NULL,
+    file_id INTEGER NOT NULL,
+    token_index INTEGER NOT NULL,
+    first_line INTEGER NOT NULL,
+    last_line INTEGER NOT NULL
+);
+"""
+INDEXES = [
+    # Covers the shared-fingerprint query, so it never reads the table itself
+    "CREATE INDEX IF NOT EXISTS fingerprints_by_hash ON fingerprints (hash, file_id)",
+    "CREATE INDEX IF NOT EXISTS fingerprints_by_file ON fingerprints (file_id)",
+]
+# Loading more files than this drops the indexes and builds them again afterwards, which is
+# about twice as fast as updating them row by row
+BULK_LOAD_FILES = 200
+
+# No capturing groups, so findall returns plain strings instead of a match object per token;
+# newlines are matched too, to record where lines end.
+TOKEN_PATTERN = re.compile(
+    r"""
+    [A-Za-z_]\w*|\n|\d+(?:\.\d*)?(?:[eE][+-]?\d+)?
+    |\#[^\n]*|--[^\n]*|/\*.*?\*/
+    |'''.*?'''|\"\"\".*?\"\"\"|'(?:\\.|[^'\\\n])*'|"(?:\\.|[^"\\\n])*"
+    |\*\*|//|==|!=|<=|>=|->|[^\s\w]
+    """,
+    re.S | re.X,
+)
+COMMENT_STARTS = ("#", "--", "/*")
+
+
+def tokenize(code_content):
+    """Splits code into tokens, ignoring whitespace and comments.
+
+    Returns (tokens, line_ends): line_ends holds, for every line break, how many tokens come
+    before it, so only the tokens that need a line number pay for one (see token_line).
+    """
+    tokens = []
+    line_ends = []
+    for token in TOKEN_PATTERN.findall(code_content):
+        first = token[0]
+        if first == "\n":
+            line_ends.append(len(tokens))
+        elif first in "#-/" and token.startswith(COMMENT_STARTS):
+            line_ends += [len(tokens)] * token.count("\n")
+        else:
+            tokens.append(token)
+            if first in "'\"" and len(token) > 5:
+                line_ends += [len(tokens)] * token.count("\n")
+    return tokens, line_ends
+
+
+def token_line(line_ends, token_index):
+    """1-based line on which the token at token_index starts."""
+    return bisect.bisect_right(line_ends, token_index) + 1
+
+
+def shingle_hashes(tokens, size=SHINGLE_TOKENS):
+    """Hashes of every run of `size` consecutive tokens (stable across processes and runs)."""
+    token_codes = {token: zlib.crc32(token.encode("utf-8")) for token in set(tokens)}
+    codes = [token_codes[token] for token in tokens]
+    # Unlike strings, tuples of ints hash the same in every process
+    return list(map(hash, zip(*[codes[offset:] for offset in range(size)])))
+
+
+def winnow(hashes, window=WINDOW):
+    """Selects the rightmost minimum hash of every window; returns [(hash, shingle_index)]."""
+    if not hashes:
+        return []
+    if len(hashes) < window:
+        index = min(range(len(hashes)), key=lambda i: (hashes[i], -i))
+        return [(hashes[index], index)]
+    selected = []
+    candidates = deque()
+    for index, value in enumerate(hashes):
+        while candidates and hashes[candidates[-1]] >= value:
+            candidates.pop()
+        candidates.append(index)
+        if candidates[0] <= index - window:
+            candidates.popleft()
+        if index >= window - 1 and (not selected or selected[-1][1] != candidates[0]):
+            selected.append((hashes[candidates[0]], candidates[0]))
+    return selected
+
+
+def fingerprint_code(code_content):
+    """Returns [(hash, token_index, first_line, last_line)] for the winnowed shingles of code."""
+    tokens, line_ends = tokenize(code_content)
+    return [
+        (value, index, token_line(line_ends, index), token_line(line_ends, index + SHINGLE_TOKENS - 1))
+        for value, index in winnow(shingle_hashes(tokens))
+    ]
+
+
+def fingerprint_file(file_path):
+    """Returns (file_path, fingerprints); runs in a worker process."""
+    try:
+        with open(file_path, "r", encoding="utf-8") as file:
+            return file_path, fingerprint_code(file.read())
+    except (OSError, UnicodeDecodeError):
+        return file_path, []
+
+
+def fingerprint_files(file_paths, max_workers=PRE_PASS_WORKERS):
+    if len(file_paths) < MIN_FILES_FOR_POOL or max_workers <= 1:
+        return [fingerprint_file(file_path) for file_path in file_paths]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(fingerprint_file, file_paths, chunksize=max(1, len(file_paths) // (max_workers * 4))))
+
+
+def _content_hash(path):
+    try:
+        with open(path, "rb") as file:
+            return hashlib.sha256(file.read()).hexdigest()
+    except OSError:
+        return ""
+
+
+class FingerprintIndex:
+    """SQLite index of the fingerprints of every file seen, kept between runs.
+
+    A file is tokenized again only when its size or mtime changed and its content hash no longer
+    matches; a file whose content is already indexed under another path copies those rows.
+    """
+
+    def __init__(self, path=FINGERPRINT_DB):
+        self.path = path
+        self._connection = None
+
+    def _db(self):
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            if self._connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                self._connection.executescript(
+                    "DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS fingerprints; "
+                    f"PRAGMA user_version = {SCHEMA_VERSION};"
+                )
+            self._connection.executescript(SCHEMA)
+            for statement in INDEXES:
+                self._connection.execute(statement)
+        return self._connection
+
+    def sync(self, file_paths, max_workers=PRE_PASS_WORKERS):
+        """Brings the index up to date with file_paths; returns {file_path: file_id} for those that exist."""
+        db = self._db()
+        known = {
+            path: (file_id, mtime_ns, size, content_hash)
+            for path, file_id, mtime_ns, size, content_hash
+            in db.execute("SELECT path, file_id, mtime_ns, size, content_hash FROM files")
+        }
+        file_ids = {}
+        stale = []
+        for file_path in file_paths:
+            path = os.path.abspath(file_path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entry = known.get(path)
+            if entry is not None and entry[1:3] == (stat.st_mtime_ns, stat.st_size):
+                file_ids[file_path] = entry[0]
+            else:
+                stale.append((file_path, path, stat, _content_hash(path)))
+        if not stale:
+            return file_ids
+
+        by_content = {content_hash: file_id for file_id, _, _, content_hash in known.values()}
+        to_fingerprint = []
+        copies = []
+        with db:
+            for file_path, path, stat, content_hash in stale:
+                entry = known.get(path)
+                if entry is not None and entry[3] == content_hash:
+                    # Touched but not edited
+                    db.execute("UPDATE files SET mtime_ns = ?, size = ? WHERE file_id = ?",
+                               (stat.st_mtime_ns, stat.st_size, entry[0]))
+                    file_ids[file_path] = entry[0]
+                    continue
+                if entry is not None:
+                    db.execute("DELETE FROM fingerprints WHERE file_id = ?", (entry[0],))
+                    db.execute("DELETE FROM files WHERE file_id = ?", (entry[0],))
+                    if by_content.get(entry[3]) == entry[0]:
+                        del by_content[entry[3]]
+                file_id = db.execute(
+                    "INSERT INTO files (path, mtime_ns, size, content_hash) VALUES (?, ?, ?, ?)",
+                    (path, stat.st_mtime_ns, stat.st_size, content_hash),
+                ).lastrowid
+                file_ids[file_path] = file_id
+                if content_hash in by_content:
+                    copies.append((file_id, by_content[content_hash]))
+                else:
+                    by_content[content_hash] = file_id
+                    to_fingerprint.append(file_path)
+            bulk_load = len(to_fingerprint) > BULK_LOAD_FILES
+            if bulk_load:
+                db.execute("DROP INDEX IF EXISTS fingerprints_by_hash")
+                db.execute("DROP INDEX IF EXISTS fingerprints_by_file")
+            for file_path, fingerprints in fingerprint_files(to_fingerprint, max_workers):
+                file_id = file_ids[file_path]
+                db.executemany(
+                    "INSERT INTO fingerprints VALUES (?, ?, ?, ?, ?)",
+                    [(value, file_id, index, first_line, last_line)
+                     for value, index, first_line, last_line in fingerprints],
+                )
+            if bulk_load:
+                for statement in INDEXES:
+                    db.execute(statement)
+            # Copies go last, as the file they copy may have been fingerprinted in this run
+            for file_id, copy_of in copies:
+                db.execute(
+                    "INSERT INTO fingerprints SELECT hash, ?, token_index, first_line, last_line "
+                    "FROM fingerprints WHERE file_id = ?",
+                    (file_id, copy_of),
+                )
+        return file_ids
+
+    def shared_fingerprints(self, file_ids, changed_ids=None):
+        """Returns {hash: [(file_id, token_index, first_line, last_line)]} for the fingerprints found in
+        2 to MAX_OCCURRENCES places among file_ids; with changed_ids, only fingerprints of those files.
+        """
+        db = self._db()
+        db.execute("CREATE TEMP TABLE IF NOT EXISTS run_files (file_id INTEGER PRIMARY KEY)")
+        db.execute("DELETE FROM run_files")
+        db.executemany("INSERT OR IGNORE INTO run_files VALUES (?)", [(file_id,) for file_id in file_ids])
+        if changed_ids is None:
+            # Counted inside SQLite, so fingerprints found only once never reach Python
+            candidates = (
+                "SELECT hash FROM fingerprints JOIN run_files USING (file_id) "
+                "GROUP BY hash HAVING COUNT(*) BETWEEN 2 AND ?"
+            )
+            parameters = [MAX_OCCURRENCES]
+        else:
+            parameters = list(changed_ids)
+            candidates = f"SELECT hash FROM fingerprints WHERE file_id IN ({', '.join('?' * len(parameters))})"
+        shared = defaultdict(list)
+        rows = db.execute(
+            "SELECT hash, file_id, token_index, first_line, last_line "
+            f"FROM fingerprints JOIN run_files USING (file_id) WHERE hash IN ({candidates})",
+            parameters,
+        )
+        for value, file_id, token_index, first_line, last_line in rows:
+            shared[value].append((file_id, token_index, first_line, last_line))
+        return {value: occurrences for value, occurrences in shared.items()
+                if 2 <= len(occurrences) <= MAX_OCCURRENCES}
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def _merge_matches(matches):
+    """Merges fingerprint matches between two files into contiguous clone regions."""
+    regions = []
+    current = None
+    for match in sorted(matches):
+        index_a, first_a, last_a, index_b, first_b, last_b = match
+        if (current is not None
+                and 0 <= index_a - current["last_index_a"] <= SHINGLE_TOKENS + WINDOW
+                and 0 <= index_b - current["last_index_b"] <= SHINGLE_TOKENS + WINDOW):
+            current["last_index_a"], current["last_index_b"] = index_a, index_b
+            current["lines_a"] = (current["lines_a"][0], max(current["lines_a"][1], last_a))
+            current["lines_b"] = (min(current["lines_b"][0], first_b), max(current["lines_b"][1], last_b))
+            continue
+        current = {
+            "first_index_a": index_a, "last_index_a": index_a, "last_index_b": index_b,
+            "lines_a": (first_a, last_a), "lines_b": (first_b, last_b),
+        }
+        regions.append(current)
+    return [region for region in regions
+            if region["last_index_a"] - region["first_index_a"] + SHINGLE_TOKENS >= MIN_CLONE_TOKENS]
+
+
+def find_clones(file_paths, max_workers=PRE_PASS_WORKERS, changed=None, index_path=FINGERPRINT_DB):
+    """Finds code duplicated within and across files.
+
+    Returns a list of {"file", "lines", "other_file", "other_lines"} with 1-based inclusive
+    line ranges. Whitespace and comments are ignored; identifiers and literals must match.
+    Fingerprints come from the FingerprintIndex at index_path, so only files that are new or
+    edited since the last run are tokenized. With changed, only clones involving one of the
+    changed files are looked up, against the indexed fingerprints of all of file_paths.
+    """
+    index = FingerprintIndex(index_path)
+    try:
+        file_ids = index.sync(file_paths, max_workers)
+        changed_ids = None
+        if changed is not None:
+            changed_paths = {os.path.abspath(file_path) for file_path in changed}
+            changed_ids = {file_id for file_path, file_id in file_ids.items()
+                           if os.path.abspath(file_path) in changed_paths}
+        shared = index.shared_fingerprints(file_ids.values(), changed_ids)
+    finally:
+        index.close()
+    paths = {file_id: file_path for file_path, file_id in file_ids.items()}
+
+    matches = defaultdict(list)
+    for occurrences in shared.values():
+        for a, b in combinations(sorted(occurrences), 2):
+            if changed_ids is not None and a[0] not in changed_ids and b[0] not in changed_ids:
+                continue
+            if a[0] == b[0] and b[1] - a[1] < MIN_CLONE_TOKENS:
+                continue  # overlapping or repeating text inside one file
+            matches[(a[0], b[0])].append((a[1], a[2], a[3], b[1], b[2], b[3]))
+
+    clones = []
+    for (file_a, file_b), pair_matches in sorted(matches.items()):
+        for region in _merge_matches(pair_matches):
+            clones.append({
+                "file": paths[file_a],
+                "lines": region["lines_a"],
+                "other_file": paths[file_b],
+                "other_lines": region["lines_b"],
+            })
+    return clones
+
+
+def duplicate_findings(clones):
+    """Turns clones into "Duplicate Code" findings for both copies; returns {file_path: findings}."""
+    findings = defaultdict(list)
+    for clone in clones:
+        copies = [(clone["file"], clone["lines"], clone["other_file"], clone["other_lines"]),
+                  (clone["other_file"], clone["other_lines"], clone["file"], clone["lines"])]
+        for file_path, (first, last), other_file, (other_first, other_last) in copies:
+            if other_file != file_path:
+                where = f"in {other_file}"
+            else:
+                where = "later in this file" if other_first > first else "earlier in this file"
+            findings[file_path].append({
+                "file": file_path,
+                "section": "Duplicate Code",
+                "line": first,
+                "identification": f"Lines {first}-{last} duplicate lines {other_first}-{other_last} {where}",
+                "explanation": "",
+                "fix": "Move the shared code into one function or module and call it from both places.",
+                "criticality": "Medium" if last - first >= 20 else "Low",
+            })
+    return findings
+
+
+def duplicate_section_html(findings, number):
+    """Renders the locally detected duplicates as the report's numbered Duplicate Code table."""
+    return render_findings_html(findings, sections=["Duplicate Code"], start=number)
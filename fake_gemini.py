@@ -0,0 +1,132 @@
+import asyncio
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+# Defaults roughly match gemini-1.5-flash on the review prompts: a few seconds to the
+# first token, then ~150 output tokens per second.
+TIME_TO_FIRST_TOKEN = 1.5
+TIME_TO_FIRST_TOKEN_SIGMA = 0.5
+TOKENS_PER_SECOND = 150.0
+RESPONSE_TOKENS = 1200
+RESPONSE_TOKENS_PER_PROMPT_TOKEN = 0.25
+CHUNK_TOKENS = 40
+
+
+class FakeServiceError(Exception):
+    """Stand-in for google.api_core 503 ServiceUnavailable."""
+    code = 503
+
+
+class FakeQuotaError(Exception):
+    """Stand-in for google.api_core 429 ResourceExhausted, with a retry-after hint."""
+    code = 429
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+def _prompt_text(contents):
+    if isinstance(contents, str):
+        return contents
+    return "\n".join(str(part) for part in contents)
+
+
+def _response(text, prompt_tokens, output_tokens, finish_reason="STOP"):
+    return SimpleNamespace(
+        text=text,
+        usage_metadata=SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens,
+        ),
+        candidates=[SimpleNamespace(finish_reason=finish_reason)],
+    )
+
+
+class FakeGenerativeModel:
+    """Offline stand-in for vertexai GenerativeModel with configurable latency, streaming and errors.
+
+    time_scale shrinks every simulated delay so a benchmark of a large corpus finishes quickly;
+    relative timings between execution modes are preserved.
+    """
+
+    def __init__(self, model_name="gemini-1.5-flash-001", system_instruction=None,
+                 ttft=TIME_TO_FIRST_TOKEN, ttft_sigma=TIME_TO_FIRST_TOKEN_SIGMA,
+                 tokens_per_second=TOKENS_PER_SECOND, response_tokens=RESPONSE_TOKENS,
+                 response_ratio=RESPONSE_TOKENS_PER_PROMPT_TOKEN, chunk_tokens=CHUNK_TOKENS,
+                 error_rate=0.0, quota_rate=0.0, retry_after=2.0, time_scale=1.0, seed=None):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.ttft = ttft
+        self.ttft_sigma = ttft_sigma
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.response_ratio = response_ratio
+        self.chunk_tokens = chunk_tokens
+        self.error_rate = error_rate
+        self.quota_rate = quota_rate
+        self.retry_after = retry_after
+        self.time_scale = time_scale
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _plan(self, contents, generation_config):
+        """Draws the outcome of one call: injected error or (ttft, prompt_tokens, output_tokens)."""
+        prompt_tokens = estimate_tokens(_prompt_text(contents))
+        max_output_tokens = (generation_config or {}).get("max_output_tokens", 8192)
+        with self._lock:
+            self.calls += 1
+            roll = self._random.random()
+            ttft = self._random.lognormvariate(0, self.ttft_sigma) * self.ttft
+            jitter = self._random.uniform(0.7, 1.3)
+        if roll < self.quota_rate:
+            time.sleep(0.05 * self.time_scale)
+            raise FakeQuotaError("429 Resource exhausted: quota exceeded", self.retry_after * self.time_scale)
+        if roll < self.quota_rate + self.error_rate:
+            time.sleep(ttft * self.time_scale)
+            raise FakeServiceError("503 Service unavailable")
+        output_tokens = int((self.response_tokens + prompt_tokens * self.response_ratio) * jitter)
+        finish_reason = "STOP"
+        if output_tokens > max_output_tokens:
+            output_tokens = max_output_tokens
+            finish_reason = "MAX_TOKENS"
+        return ttft, prompt_tokens, output_tokens, finish_reason
+
+    def _body(self, output_tokens):
+        row = "<tr><td>Line 1: finding</td><td>explanation</td><td>fix</td></tr>"
+        rows = max(1, output_tokens * 4 // len(row))
+        return "<table>" + row * rows + "</table>"
+
+    def generate_content(self, contents, generation_config=None, safety_settings=None, stream=False, **kwargs):
+        ttft, prompt_tokens, output_tokens, finish_reason = self._plan(contents, generation_config)
+        text = self._body(output_tokens)
+        if stream:
+            return self._stream(text, ttft, prompt_tokens, output_tokens, finish_reason)
+        time.sleep((ttft + output_tokens / self.tokens_per_second) * self.time_scale)
+        return _response(text, prompt_tokens, output_tokens, finish_reason)
+
+    def _stream(self, text, ttft, prompt_tokens, output_tokens, finish_reason):
+        time.sleep(ttft * self.time_scale)
+        chunk_chars = self.chunk_tokens * 4
+        pieces = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+        for index, piece in enumerate(pieces):
+            if index:
+                time.sleep(self.chunk_tokens / self.tokens_per_second * self.time_scale)
+            last = index == len(pieces) - 1
+            yield _response(piece, prompt_tokens, output_tokens if last else 0, finish_reason if last else None)
+
+    async def generate_content_async(self, contents, generation_config=None, safety_settings=None, **kwargs):
+        ttft, prompt_tokens, output_tokens, finish_reason = self._plan(contents, generation_config)
+        await asyncio.sleep((ttft + output_tokens / self.tokens_per_second) * self.time_scale)
+        return _response(self._body(output_tokens), prompt_tokens, output_tokens, finish_reason)
+
+    def count_tokens(self, contents):
+        return SimpleNamespace(total_tokens=estimate_tokens(_prompt_text(contents)))
@@ -1,42 +1,178 @@
 import os
+import queue
+import threading
 import time
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from google.cloud import storage
+from gcs_upload import GcsBucket, LocalBucket, UploadManifest, UploadState, upload_if_changed
 
 # Set these variables according to your environment
 WATCH_DIRECTORY = '/path/to/watch'  # Directory to monitor
 GCS_BUCKET_NAME = 'your-gcs-bucket'
 GCS_DESTINATION_PREFIX = ''  # Optional: path prefix in the bucket ('' = root)
+# Set to a directory to upload into a filesystem-backed stand-in instead of GCS (for testing);
+# set STORAGE_EMULATOR_HOST to use a GCS emulator instead.
+LOCAL_BUCKET_DIRECTORY = None
+# A file is uploaded once no event has been seen for it for this many seconds
+QUIET_PERIOD = 2.0
+UPLOAD_WORKERS = 8
+# Paths waiting for a worker; the debouncer blocks when it is full
+UPLOAD_QUEUE_SIZE = 1000
+
+_storage_client = None
+_client_lock = threading.Lock()
+_buckets = {}
+# Progress of large uploads, persisted so a restarted uploader resumes them
+upload_state = UploadState()
+# What was last uploaded for each path, so identical content is never sent again
+upload_manifest = UploadManifest()
+
+
+def get_storage_client():
+    """Returns the one GCS client shared by all upload workers (make sure GOOGLE_APPLICATION_CREDENTIALS is set)."""
+    global _storage_client
+    with _client_lock:
+        if _storage_client is None:
+            from google.cloud import storage
+
+            _storage_client = storage.Client()
+        return _storage_client
+
+
+def get_bucket(bucket_name):
+    """Returns the bucket to upload into: the local stand-in when LOCAL_BUCKET_DIRECTORY is set, else GCS."""
+    with _client_lock:
+        if bucket_name not in _buckets and LOCAL_BUCKET_DIRECTORY:
+            _buckets[bucket_name] = LocalBucket(os.path.join(LOCAL_BUCKET_DIRECTORY, bucket_name))
+    if bucket_name not in _buckets:
+        client = get_storage_client()
+        with _client_lock:
+            _buckets.setdefault(bucket_name, GcsBucket(client, bucket_name))
+    return _buckets[bucket_name]
 
-# Initialize GCS client (make sure GOOGLE_APPLICATION_CREDENTIALS is set)
-storage_client = storage.Client()
 
 def upload_to_gcs(source_file, bucket_name, destination_blob_name):
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(destination_blob_name)
-    blob.upload_from_filename(source_file)
-    print(f"Uploaded {source_file} to gs://{bucket_name}/{destination_blob_name}")
+    bucket = get_bucket(bucket_name)
+    if upload_if_changed(bucket, source_file, destination_blob_name, upload_state, upload_manifest):
+        print(f"Uploaded {source_file} to {bucket.url(destination_blob_name)}")
+    else:
+        print(f"Skipped {source_file}: {bucket.url(destination_blob_name)} already has the same content")
+
+
+def destination_for(source_file):
+    filename = os.path.basename(source_file)
+    return os.path.join(GCS_DESTINATION_PREFIX, filename)
+
+
+class UploadQueue:
+    """Coalesces file events per path and uploads each path once it has been quiet for quiet_period.
+
+    Events only record a timestamp, so the observer thread never blocks. A debounce thread moves
+    quiet paths onto a bounded queue drained by a pool of upload workers. A path is never uploaded
+    by two workers at once: an event for a path being uploaded waits, and the path is queued again
+    once that upload has finished and it has been quiet.
+    """
+
+    def __init__(self, upload=None, quiet_period=QUIET_PERIOD, workers=UPLOAD_WORKERS, queue_size=UPLOAD_QUEUE_SIZE):
+        self.upload = upload or (lambda path: upload_to_gcs(path, GCS_BUCKET_NAME, destination_for(path)))
+        self.quiet_period = quiet_period
+        self.workers = workers
+        self._last_event = {}
+        self._in_flight = set()
+        self._condition = threading.Condition()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stopping = False
+        self._threads = []
+
+    def touch(self, path):
+        """Records an event for path, restarting its quiet period."""
+        with self._condition:
+            self._last_event[path] = time.monotonic()
+            self._condition.notify()
+
+    def start(self):
+        self._threads = [threading.Thread(target=self._debounce, name="upload-debounce", daemon=True)]
+        self._threads += [
+            threading.Thread(target=self._work, name=f"upload-worker-{number}", daemon=True)
+            for number in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def _debounce(self):
+        while True:
+            with self._condition:
+                while True:
+                    now = time.monotonic()
+                    waiting = {path: seen for path, seen in self._last_event.items() if path not in self._in_flight}
+                    if self._stopping:
+                        ready = list(waiting)
+                    else:
+                        ready = [path for path, seen in waiting.items() if now - seen >= self.quiet_period]
+                    if ready or (self._stopping and not self._last_event):
+                        break
+                    # Paths still being uploaded wake this thread when their upload finishes
+                    wait = min(waiting.values()) + self.quiet_period - now if waiting and not self._stopping else None
+                    self._condition.wait(timeout=wait)
+                for path in ready:
+                    del self._last_event[path]
+                    self._in_flight.add(path)
+                stopping = self._stopping and not self._last_event
+            for path in ready:
+                self._queue.put(path)
+            if stopping:
+                for _ in range(self.workers):
+                    self._queue.put(None)
+                return
+
+    def _work(self):
+        while True:
+            path = self._queue.get()
+            try:
+                if path is None:
+                    return
+                self.upload(path)
+            except FileNotFoundError:
+                print(f"Skipped {path}: it was removed before it could be uploaded")
+            except Exception as e:
+                print(f"Error uploading {path}: {e}")
+            finally:
+                with self._condition:
+                    self._in_flight.discard(path)
+                    self._condition.notify()
+                self._queue.task_done()
+
+    def stop(self):
+        """Uploads the paths still waiting, then stops the workers."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        for thread in self._threads:
+            thread.join()
+
 
 class NewFileHandler(FileSystemEventHandler):
+    def __init__(self, uploads):
+        super().__init__()
+        self.uploads = uploads
+
     def on_created(self, event):
         if not event.is_directory:
-            # Wait a bit to ensure file is closed/written
-            time.sleep(2)
-            filename = os.path.basename(event.src_path)
-            gcs_path = os.path.join(GCS_DESTINATION_PREFIX, filename)
-            upload_to_gcs(event.src_path, GCS_BUCKET_NAME, gcs_path)
+            self.uploads.touch(event.src_path)
 
     def on_modified(self, event):
         if not event.is_directory:
-            # Wait a bit to ensure file is closed/written
-            time.sleep(2)
-            filename = os.path.basename(event.src_path)
-            gcs_path = os.path.join(GCS_DESTINATION_PREFIX, filename)
-            upload_to_gcs(event.src_path, GCS_BUCKET_NAME, gcs_path)
+            self.uploads.touch(event.src_path)
 
 if __name__ == "__main__":
-    event_handler = NewFileHandler()
+    uploads = UploadQueue().start()
+    # Finish the large uploads an earlier run was interrupted in
+    for destination, source in upload_state.pending():
+        if os.path.isfile(source):
+            print(f"Resuming the interrupted upload of {source}")
+            uploads.touch(source)
+    event_handler = NewFileHandler(uploads)
     observer = Observer()
     observer.schedule(event_handler, WATCH_DIRECTORY, recursive=True)
     observer.start()
@@ -47,3 +183,5 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         observer.stop()
     observer.join()
+    uploads.stop()
+    upload_manifest.close()
@@ -0,0 +1,190 @@
+import html
+import json
+import re
+
+SECTIONS = [
+    "Syntax Errors",
+    "Code Bugs",
+    "Security Vulnerabilities",
+    "Duplicate Code",
+    "Code Improvement Suggestions",
+]
+# Sections whose table has a Suggestion column instead of Explanation and Fix
+SUGGESTION_SECTIONS = {"Duplicate Code", "Code Improvement Suggestions"}
+NONE_FOUND = {
+    "Syntax Errors": "No Syntax Errors Found",
+    "Code Bugs": "No Code Bugs Found",
+    "Security Vulnerabilities": "No Security Vulnerabilities Found",
+    "Duplicate Code": "No duplicate code in this file",
+    "Code Improvement Suggestions": "No Code Improvement Suggestions Found",
+}
+# Duplicate Code is detected locally across the whole tree (see duplicates.py)
+MODEL_SECTIONS = [section for section in SECTIONS if section != "Duplicate Code"]
+CRITICALITIES = ["Low", "Medium", "High"]
+
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "findings": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "file": {"type": "string"},
+                    "section": {"type": "string", "enum": MODEL_SECTIONS},
+                    "line": {"type": "integer"},
+                    "identification": {"type": "string"},
+                    "explanation": {"type": "string"},
+                    "fix": {"type": "string"},
+                    "criticality": {"type": "string", "enum": CRITICALITIES},
+                },
+                "required": ["section", "line", "identification", "explanation", "fix", "criticality"],
+            },
+        },
+    },
+    "required": ["findings"],
+}
+
+STRUCTURED_INSTRUCTIONS = """You are an intelligent code expert. Review the code and report findings in these sections:
+1. Syntax Errors: exact syntax errors.
+2. Code Bugs: logical or runtime errors.
+3. Security Vulnerabilities: e.g. SQL injection, XSS, insecure deserialization, hard-coded secrets.
+4. Code Improvement Suggestions: unnecessary complexity, redundant blocks, more concise constructs.
+
+For each finding give:
+- section: one of the four section names above.
+- line: the line number from the "Line N:" prefix where the issue starts.
+- identification: a short statement of the issue.
+- explanation: why it is a problem (for Code Improvement Suggestions, may be empty).
+- fix: the specific change to make, without rewriting the whole code.
+- criticality: Low (minor, no effect on execution), Medium (wrong results in some cases), High (fails or is exploitable).
+Return only the JSON object; report no findings for a section that has none.
+"""
+
+STRUCTURED_BATCH_INSTRUCTIONS = """The code below contains several independent files. Each file starts with a line
+"===== FILE: <path> =====" and ends with "===== END FILE: <path> =====".
+Review every file separately and set the file field of each finding to the path from its FILE line.
+"""
+
+TABLE_OPEN = """<table width="100%" border="1" cellpadding="8" style="border-collapse: collapse; font-family: 'Times New Roman'; overflow-wrap: break-word;">"""
+SECTION_HEADING = """<p style="font-family: 'Times New Roman'; color: black; text-align: left;"><strong>{number}. {section}</strong></p>"""
+
+
+def structured_prompt(code_content, note=""):
+    """Creates the compact JSON-output review prompt."""
+    return f"""{STRUCTURED_INSTRUCTIONS}
+{note}The code:
+{code_content}
+"""
+
+
+def structured_generation_config(generation_config):
+    """Returns a copy of generation_config that asks for JSON matching RESPONSE_SCHEMA."""
+    config = dict(generation_config)
+    config["response_mime_type"] = "application/json"
+    config["response_schema"] = RESPONSE_SCHEMA
+    return config
+
+
+def _normalize(finding):
+    section = finding.get("section", "")
+    if section not in SECTIONS:
+        matches = [name for name in SECTIONS if name.lower().startswith(str(section).lower()[:6])]
+        section = matches[0] if matches else "Code Improvement Suggestions"
+    criticality = str(finding.get("criticality", "Low")).capitalize()
+    try:
+        line = int(finding.get("line", 0))
+    except (TypeError, ValueError):
+        line = 0
+    return {
+        "file": finding.get("file", ""),
+        "section": section,
+        "line": line,
+        "identification": str(finding.get("identification", "")).strip(),
+        "explanation": str(finding.get("explanation", "")).strip(),
+        "fix": str(finding.get("fix", "")).strip(),
+        "criticality": criticality if criticality in CRITICALITIES else "Low",
+    }
+
+
+def parse_findings(response_text):
+    """Parses a JSON review response into a list of normalized finding dicts."""
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", response_text.strip())
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get("findings", [])
+    if not isinstance(data, list):
+        raise ValueError("Review response is not a list of findings")
+    return [_normalize(finding) for finding in data if isinstance(finding, dict)]
+
+
+def _path_parts(file_path):
+    """Path components without "." or empty parts, accepting both slash styles."""
+    return [part for part in re.split(r"[\\/]+", str(file_path).strip()) if part not in ("", ".")]
+
+
+def attribute_file(file, file_paths):
+    """Returns the requested path a finding's file names, or None.
+
+    The model may write the path differently, e.g. "./x.py", with backslashes or as a basename,
+    so the path matches if either one is a trailing part of the other and no other path matches.
+    """
+    parts = _path_parts(file)
+    if not parts:
+        return None
+    matches = []
+    for file_path in file_paths:
+        requested = _path_parts(file_path)
+        shorter = min(len(parts), len(requested))
+        if parts[-shorter:] == requested[-shorter:]:
+            if len(parts) == len(requested):
+                return file_path
+            matches.append(file_path)
+    return matches[0] if len(matches) == 1 else None
+
+
+def group_findings_by_file(findings, file_paths):
+    """Splits batched findings into ({file_path: findings}, unattributed findings).
+
+    Every requested path gets an entry; findings whose file matches no single requested path are
+    returned separately, so the caller can review those files again instead of calling them clean.
+    """
+    grouped = {file_path: [] for file_path in file_paths}
+    unattributed = []
+    for finding in findings:
+        file_path = attribute_file(finding["file"], file_paths)
+        if file_path is None:
+            unattributed.append(finding)
+        else:
+            grouped[file_path].append(dict(finding, file=file_path))
+    return grouped, unattributed
+
+
+def _cell(text):
+    return f"<td>{html.escape(text)}</td>"
+
+
+def render_findings_html(findings, sections=SECTIONS, start=1):
+    """Renders findings as the numbered section tables the HTML prompts used to ask the model for."""
+    parts = []
+    for number, section in enumerate(sections, start=start):
+        parts.append(SECTION_HEADING.format(number=number, section=section))
+        parts.append(TABLE_OPEN)
+        if section in SUGGESTION_SECTIONS:
+            parts.append("<tr><th>Identification</th><th>Suggestion</th><th>Criticality</th></tr>")
+        else:
+            parts.append("<tr><th>Identification</th><th>Explanation</th><th>Fix</th><th>Criticality</th></tr>")
+        rows = sorted((f for f in findings if f["section"] == section), key=lambda f: f["line"])
+        for finding in rows:
+            identification = f"Line {finding['line']}: {finding['identification']}"
+            if section in SUGGESTION_SECTIONS:
+                suggestion = " ".join(part for part in (finding["explanation"], finding["fix"]) if part)
+                parts.append(f"<tr>{_cell(identification)}{_cell(suggestion)}{_cell(finding['criticality'])}</tr>")
+            else:
+                parts.append(f"<tr>{_cell(identification)}{_cell(finding['explanation'])}"
+                             f"{_cell(finding['fix'])}{_cell(finding['criticality'])}</tr>")
+        if not rows:
+            columns = 3 if section in SUGGESTION_SECTIONS else 4
+            parts.append(f'<tr><td colspan="{columns}">{NONE_FOUND[section]}</td></tr>')
+        parts.append("</table>")
+    return "\n".join(parts)
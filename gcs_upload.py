@@ -0,0 +1,369 @@
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import google_crc32c
+except ImportError:  # MD5 is used instead; composite objects carry no MD5, so their remote check never matches
+    google_crc32c = None
+
+# GCS requires resumable upload chunks to be a multiple of 256 KiB
+CHUNK_SIZE = 8 * 1024 * 1024
+# Files at least this large are uploaded as parts that are composed server-side
+LARGE_FILE_BYTES = 128 * 1024 * 1024
+PART_SIZE = 64 * 1024 * 1024
+# Parts of one file uploaded at once; 1 uploads them one after another
+COMPOSITE_WORKERS = 4
+MAX_COMPOSE_SOURCES = 32
+PART_SUFFIX = ".parts"
+UPLOAD_STATE_FILE = ".gcs_upload_state.json"
+UPLOAD_MANIFEST_FILE = ".gcs_upload_manifest.sqlite3"
+
+MANIFEST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    path TEXT PRIMARY KEY,
+    destination TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    algorithm TEXT NOT NULL,
+    checksum TEXT NOT NULL,
+    uploaded_at REAL NOT NULL
+)
+"""
+
+_destination_locks = {}
+_destination_locks_lock = threading.Lock()
+
+
+def destination_lock(name):
+    """The lock that serializes uploads to one object name, so concurrent uploads cannot interleave."""
+    with _destination_locks_lock:
+        return _destination_locks.setdefault(name, threading.Lock())
+
+
+class GcsBucket:
+    """A Google Cloud Storage bucket; set STORAGE_EMULATOR_HOST to run against a local emulator."""
+
+    def __init__(self, client, bucket_name, chunk_size=CHUNK_SIZE):
+        self.bucket = client.bucket(bucket_name)
+        self.name = bucket_name
+        self.chunk_size = chunk_size
+
+    def url(self, name):
+        return f"gs://{self.name}/{name}"
+
+    def upload_file(self, name, file_path):
+        self.bucket.blob(name, chunk_size=self.chunk_size).upload_from_filename(file_path)
+
+    def upload_range(self, name, file_path, offset, length):
+        with open(file_path, "rb") as file:
+            file.seek(offset)
+            self.bucket.blob(name, chunk_size=self.chunk_size).upload_from_file(file, size=length)
+
+    def exists(self, name):
+        return self.bucket.blob(name).exists()
+
+    def compose(self, name, sources):
+        self.bucket.blob(name).compose([self.bucket.blob(source) for source in sources])
+
+    def checksum(self, name, algorithm):
+        """The object's base64 CRC32C or MD5 as GCS reports it, or None if it does not exist."""
+        blob = self.bucket.get_blob(name)
+        if blob is None:
+            return None
+        return blob.crc32c if algorithm == "crc32c" else blob.md5_hash
+
+    def delete(self, names):
+        from google.api_core.exceptions import NotFound
+
+        for name in names:
+            try:
+                self.bucket.blob(name).delete()
+            except NotFound:
+                pass
+
+
+class LocalBucket:
+    """Filesystem stand-in for a bucket, for testing uploads without GCS; objects are files under root."""
+
+    def __init__(self, root, chunk_size=CHUNK_SIZE):
+        self.root = root
+        self.chunk_size = chunk_size
+
+    def _path(self, name):
+        return os.path.join(self.root, *name.replace("\\", "/").split("/"))
+
+    def url(self, name):
+        return f"file://{os.path.abspath(self._path(name))}"
+
+    def _write(self, name, chunks):
+        # Objects appear whole or not at all, as in GCS
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as target:
+            for chunk in chunks:
+                target.write(chunk)
+        os.replace(temporary, path)
+
+    def _read(self, file_path, offset=0, length=None):
+        with open(file_path, "rb") as source:
+            source.seek(offset)
+            remaining = length
+            while remaining is None or remaining > 0:
+                chunk = source.read(self.chunk_size if remaining is None else min(self.chunk_size, remaining))
+                if not chunk:
+                    return
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def upload_file(self, name, file_path):
+        self._write(name, self._read(file_path))
+
+    def upload_range(self, name, file_path, offset, length):
+        self._write(name, self._read(file_path, offset, length))
+
+    def exists(self, name):
+        return os.path.isfile(self._path(name))
+
+    def compose(self, name, sources):
+        self._write(name, (chunk for source in sources for chunk in self._read(self._path(source))))
+
+    def checksum(self, name, algorithm):
+        if not self.exists(name):
+            return None
+        return file_checksum(self._path(name), algorithm, self.chunk_size)[1]
+
+    def delete(self, names):
+        for name in names:
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
+        # Like GCS, drop the "directories" left empty
+        for directory in {os.path.dirname(self._path(name)) for name in names}:
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+
+
+class UploadState:
+    """JSON record of the parts of each large upload already in the bucket, so a restart resumes it."""
+
+    def __init__(self, path=UPLOAD_STATE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._uploads = None
+
+    def _load(self):
+        # Callers hold self._lock
+        if self._uploads is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as state_file:
+                    self._uploads = json.load(state_file)
+            except (FileNotFoundError, ValueError):
+                self._uploads = {}
+        return self._uploads
+
+    def _save(self):
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as state_file:
+            json.dump(self._uploads, state_file)
+        os.replace(temporary, self.path)
+
+    def begin(self, name, source, signature):
+        """Returns (parts already uploaded for name, signature of an abandoned earlier upload or None).
+
+        The upload starts over when the source file changed since its parts were uploaded.
+        """
+        with self._lock:
+            uploads = self._load()
+            entry = uploads.get(name)
+            if entry is not None and entry["signature"] == signature and entry.get("source") == source:
+                return set(entry["done"]), None
+            uploads[name] = {"source": source, "signature": signature, "done": []}
+            self._save()
+            return set(), entry["signature"] if entry is not None else None
+
+    def pending(self):
+        """Returns (name, source) of the uploads an earlier run left unfinished."""
+        with self._lock:
+            return [(name, entry["source"]) for name, entry in self._load().items() if entry.get("source")]
+
+    def part_done(self, name, index):
+        with self._lock:
+            self._load()[name]["done"].append(index)
+            self._save()
+
+    def forget(self, name):
+        """Drops the record of name's upload; returns its signature, or None if there was none."""
+        with self._lock:
+            entry = self._load().pop(name, None)
+            if entry is None:
+                return None
+            self._save()
+            return entry["signature"]
+
+
+def file_checksum(file_path, algorithm=None, chunk_size=CHUNK_SIZE):
+    """Returns (algorithm, base64 digest) of a file, in the encoding GCS uses for crc32c and md5Hash."""
+    algorithm = algorithm or ("crc32c" if google_crc32c is not None else "md5")
+    digest = google_crc32c.Checksum() if algorithm == "crc32c" else hashlib.md5()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return algorithm, base64.b64encode(digest.digest()).decode("ascii")
+
+
+class UploadManifest:
+    """SQLite manifest of path -> (destination, size, mtime, checksum) for every upload, kept across restarts."""
+
+    def __init__(self, path=UPLOAD_MANIFEST_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _db(self):
+        # Callers hold self._lock
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(MANIFEST_SCHEMA)
+            self._connection.commit()
+        return self._connection
+
+    def get(self, file_path):
+        with self._lock:
+            row = self._db().execute(
+                "SELECT destination, size, mtime_ns, algorithm, checksum FROM uploads WHERE path = ?",
+                (os.path.abspath(file_path),),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("destination", "size", "mtime_ns", "algorithm", "checksum"), row))
+
+    def record(self, file_path, destination, stat, algorithm, checksum):
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO uploads (path, destination, size, mtime_ns, algorithm, checksum, uploaded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (os.path.abspath(file_path), destination, stat.st_size, stat.st_mtime_ns, algorithm, checksum, time.time()),
+            )
+            db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+def upload_if_changed(bucket, file_path, name, state, manifest):
+    """Uploads file_path unless the same bytes were already sent to name; returns True if it uploaded.
+
+    Unchanged size and mtime skip the file without reading it. Otherwise its checksum is compared
+    with the manifest (content rewritten or only touched) and then with the remote object's hash
+    (already in the bucket, e.g. uploaded before the manifest existed).
+    """
+    stat = os.stat(file_path)
+    entry = manifest.get(file_path)
+    if (entry is not None and entry["destination"] == name
+            and (entry["size"], entry["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns)):
+        return False
+    algorithm, checksum = file_checksum(file_path, chunk_size=bucket.chunk_size)
+    same_as_manifest = (entry is not None and entry["destination"] == name
+                        and (entry["algorithm"], entry["checksum"]) == (algorithm, checksum))
+    if same_as_manifest or bucket.checksum(name, algorithm) == checksum:
+        manifest.record(file_path, name, stat, algorithm, checksum)
+        return False
+    upload_file(bucket, file_path, name, state)
+    manifest.record(file_path, name, stat, algorithm, checksum)
+    return True
+
+
+def part_name(name, index):
+    return f"{name}{PART_SUFFIX}/{index:05d}"
+
+
+def compose_plan(name, sources):
+    """Returns the [(object, sources)] compose steps that build name in rounds of MAX_COMPOSE_SOURCES."""
+    steps = []
+    level = 0
+    while len(sources) > MAX_COMPOSE_SOURCES:
+        composed = []
+        for start in range(0, len(sources), MAX_COMPOSE_SOURCES):
+            intermediate = f"{name}{PART_SUFFIX}/composed-{level}-{start // MAX_COMPOSE_SOURCES:05d}"
+            steps.append((intermediate, sources[start:start + MAX_COMPOSE_SOURCES]))
+            composed.append(intermediate)
+        sources = composed
+        level += 1
+    steps.append((name, sources))
+    return steps
+
+
+def temporary_objects(name, size, part_size):
+    """The part and intermediate objects a composite upload of size bytes creates."""
+    parts = [part_name(name, index) for index in range(-(-size // part_size))]
+    return parts + [step for step, _ in compose_plan(name, parts)[:-1]]
+
+
+def compose_parts(bucket, name, sources):
+    """Composes sources into name, in rounds of MAX_COMPOSE_SOURCES; returns the intermediate objects."""
+    steps = compose_plan(name, sources)
+    for target, step_sources in steps:
+        bucket.compose(target, step_sources)
+    return [target for target, _ in steps[:-1]]
+
+
+def upload_file(bucket, file_path, name, state, large_file_bytes=LARGE_FILE_BYTES, part_size=PART_SIZE,
+                workers=COMPOSITE_WORKERS):
+    """Uploads file_path to name; large files go up as resumable parts composed server-side.
+
+    Parts already recorded in state (and still in the bucket) are not sent again, so an uploader
+    restarted in the middle of a large file continues where it stopped. Uploads to the same name
+    run one at a time.
+    """
+    with destination_lock(name):
+        _upload_file(bucket, file_path, name, state, large_file_bytes, part_size, workers)
+
+
+def _upload_file(bucket, file_path, name, state, large_file_bytes, part_size, workers):
+    stat = os.stat(file_path)
+    if stat.st_size < large_file_bytes:
+        bucket.upload_file(name, file_path)
+        abandoned = state.forget(name)
+        if abandoned is not None:
+            # An interrupted large upload of this file, which has since shrunk below large_file_bytes
+            bucket.delete(temporary_objects(name, abandoned[0], abandoned[2]))
+        return
+    signature = [stat.st_size, stat.st_mtime_ns, part_size]
+    done, abandoned = state.begin(name, os.path.abspath(file_path), signature)
+    if abandoned is not None:
+        # Parts of the earlier upload may not be overwritten by this one (e.g. the file shrank)
+        bucket.delete(temporary_objects(name, abandoned[0], abandoned[2]))
+    parts = [(index, offset, min(part_size, stat.st_size - offset))
+             for index, offset in enumerate(range(0, stat.st_size, part_size))]
+    if done:
+        print(f"Resuming {file_path}: {len(done)} of {len(parts)} parts already uploaded")
+
+    def upload_part(part):
+        index, offset, length = part
+        if index in done and bucket.exists(part_name(name, index)):
+            return
+        bucket.upload_range(part_name(name, index), file_path, offset, length)
+        state.part_done(name, index)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        list(executor.map(upload_part, parts))
+    sources = [part_name(name, index) for index, _, _ in parts]
+    intermediates = compose_parts(bucket, name, sources)
+    bucket.delete(sources + intermediates)
+    state.forget(name)
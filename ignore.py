@@ -1,7 +1,11 @@
 import os
 import time
-import vertexai
-from vertexai.generative_models import GenerativeModel
+from duplicates import duplicate_findings, find_clones
+from findings import parse_findings, render_findings_html, structured_generation_config, structured_prompt
+from ignore_rules import filter_findings, load_rules
+from report_writer import HtmlReportWriter
+from telemetry import UsageRecorder
+from vertex_client import LazyModel
 
 GOOGLE_APPLICATION_CREDENTIALS = "service.json"
 PROJECT_ID = "cedar-context-433909-d9"
@@ -9,11 +13,19 @@ LOCATION = "us-central1"
 GENERATIVE_MODEL_NAME = "gemini-1.5-flash-001"
 IGNORE_FILE_NAME = "ignore.txt"
 OUTPUT_REPORT_NAME = "code_review_report.html"  # Output HTML file
+REPORT_STYLE = """
+                body { font-family: Arial, sans-serif; margin: 20px; background-color: #ecf0f1; }
+                h1 { color: #34495E; }
+                h3 { color: #34495E; }
+                h4 { color: #34495E; }
+                pre { white-space: pre-wrap; word-wrap: break-word; }
+                .error { color: red; font-weight: bold; }
+                .success { color: green; font-weight: bold; }
+"""
 
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = GOOGLE_APPLICATION_CREDENTIALS
-vertexai.init(project=PROJECT_ID, location=LOCATION)
-
-model = GenerativeModel(GENERATIVE_MODEL_NAME)
+# Vertex AI is initialized on the first model call rather than when the script is imported
+model = LazyModel(GENERATIVE_MODEL_NAME, PROJECT_ID, LOCATION, GOOGLE_APPLICATION_CREDENTIALS)
+usage = UsageRecorder()
 
 def read_file_content(file_path):
     with open(file_path, 'r') as file:
@@ -25,11 +37,10 @@ def add_line_numbers(code_content):
     return '\n'.join(numbered_lines)
 
 def read_ignore_list(file_path):
-    """Reads the ignore list from a file, handling file not found."""
+    """Reads and compiles the ignore rules (see ignore_rules.py), handling file not found."""
     try:
         file_path = os.path.abspath(file_path)
-        with open(file_path, 'r') as f:
-            return [line.strip() for line in f if line.strip()]
+        return load_rules(file_path)
     except FileNotFoundError:
         print(f"Warning: {file_path} not found. No issues will be ignored.")
         return []
@@ -37,105 +48,61 @@ def read_ignore_list(file_path):
         print(f"An error occurred while reading the ignore file: {e}")
         return []
 
-def generate_review(code_content, ignore_list):
-    prompt = f"""Please analyze the provided code snippet and provide the following information in a consistent HTML format:
-1. **Syntax Errors**:
-    - **Identification**: Identify the exact error-causing line numbers and provide the exact syntax errors.
-    - **Explanation**: Provide a clear and concise explanation of each error.
-    - **Fix**: Suggest a specific fix for each identified error, providing only the necessary code to correct it without rewriting the entire code.
-
-2. **Code Bugs**:
-    - **Identification**: Identify potential logical or runtime errors in the code.
-    - **Explanation**: Provide a detailed explanation of why the identified code segment is problematic.
-    - **Fix**: Suggest the necessary code changes to fix the bugs without rewriting the entire code.
-
-3. **Security Vulnerabilities**:
-    - **Identification**: Highlight any potential security vulnerabilities in the code (e.g., SQL injection, XSS, insecure deserialization).
-    - **Explanation**: Provide a clear explanation of each identified vulnerability.
-    - **Fix**: Suggest code changes to mitigate the security risks without rewriting the entire code.
-
-4. **Duplicate Code**:
-    - **Identification**: Highlight sections of the code lines that are duplicated.
-    - **Suggestion**: Provide recommendations without rewriting the entire code.
-
-5. **Code Improvement Suggestions**:
-    - **Identification**: Highlight sections of the code that can be improved, including unnecessary complexity or redundant blocks.
-    - **Suggestion**: Provide specific points for improvement without rewriting the entire code. If no suggestions are found, state "No Code Improvement Suggestions Found."
-    
-6. **Output Requirements**:
-    - Do not include any code snippets in your output.
-    - Ensure all responses are formatted consistently in HTML.
-
-The Code:
-{code_content}
-    
-Ignore the issues mentioned in the ignore list: {', '.join(ignore_list)}
-"""
-
-    try:
-        response = model.generate_content(
-            prompt,
-            generation_config={
-                "max_output_tokens": 8192,
-                "temperature": 0.2,
-                "top_p": 0.95,
-            }
-        )
-        return response.text.strip()  
-    except Exception as e:
-        return f"Error generating review: {str(e)}"
-
-def review_python_files_in_directory(directory_path, ignore_list):
-    all_reviews_html = ""
-    for root, dirs, files in os.walk(directory_path):
-        for filename in files:
-            if filename.endswith('.py'):
-                file_path = os.path.join(root, filename)
-                code_content = read_file_content(file_path)
-                numbered_code = add_line_numbers(code_content)
-                review = generate_review(numbered_code, ignore_list)
-                
-                all_reviews_html += f"""
-                    <h3>Review for {filename}</h3>
-                    <h4>File Path:</h4>
-                    <p>{file_path}</p>
-                    <h4>Review:</h4>
-                    <pre>{review}</pre>
-                """
-    
-    return all_reviews_html
-
-def generate_final_report(reviews_html):
-   
-    html_content = f"""
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Code Review Report</title>
-            <style>
-                body {{ font-family: Arial, sans-serif; margin: 20px; background-color: #ecf0f1; }}
-                h1 {{ color: #34495E; }}
-                h3 {{ color: #34495E; }}
-                h4 {{ color: #34495E; }}
-                pre {{ white-space: pre-wrap; word-wrap: break-word; }}
-                .error {{ color: red; font-weight: bold; }}
-                .success {{ color: green; font-weight: bold; }}
-            </style>
-        </head>
-        <body>
-            <h1>Code Review Report</h1>
-            {reviews_html}
-        </body>
-        </html>
-        """
-    return html_content
-    
-
-
-def main():
-    directory_path = input("Enter the directory path containing Python files: ")
+def generate_review(code_content, label="review"):
+    """Returns the model's findings for the code; the ignore rules are applied to them afterwards."""
+    from vertexai.generative_models import GenerationConfig
+
+    response = usage.call(
+        label,
+        GENERATIVE_MODEL_NAME,
+        model.generate_content,
+        structured_prompt(code_content),
+        generation_config=GenerationConfig(**structured_generation_config({
+            "max_output_tokens": 8192,
+            "temperature": 0.2,
+            "top_p": 0.95,
+        }))
+    )
+    return parse_findings(response.text)
+
+def review_python_files_in_directory(directory_path, ignore_list, report):
+    file_paths = [
+        os.path.join(root, filename)
+        for root, dirs, files in os.walk(directory_path)
+        for filename in files
+        if filename.endswith('.py')
+    ]
+    # Duplicate Code is found locally across all the files, not by the model
+    duplicates = duplicate_findings(find_clones(file_paths))
+    suppressed_total = 0
+    for file_path in file_paths:
+        filename = os.path.basename(file_path)
+        code_content = read_file_content(file_path)
+        numbered_code = add_line_numbers(code_content)
+        try:
+            findings = generate_review(numbered_code, file_path) + duplicates.get(file_path, [])
+        except Exception as e:
+            review = f'<p class="error">Error generating review: {str(e)}</p>'
+        else:
+            findings, suppressed = filter_findings(findings, ignore_list, file_path)
+            suppressed_total += len(suppressed)
+            review = render_findings_html(findings)
+            if suppressed:
+                review += f"<p>{len(suppressed)} finding(s) suppressed by {IGNORE_FILE_NAME}.</p>"
+
+        report.write_section(f"""
+            <h3>Review for {filename}</h3>
+            <h4>File Path:</h4>
+            <p>{file_path}</p>
+            <h4>Review:</h4>
+            {review}
+        """)
+    print(f"Findings suppressed by {IGNORE_FILE_NAME}: {suppressed_total}")
+
+
+def main(directory_path=None):
+    if directory_path is None:
+        directory_path = input("Enter the directory path containing Python files: ")
 
     if not os.path.exists(directory_path):
         print("The specified directory does not exist.")
@@ -145,18 +112,15 @@ def main():
     
     start_time = time.time()
     
-    reviews_html = review_python_files_in_directory(directory_path, ignore_list)
+    with HtmlReportWriter(OUTPUT_REPORT_NAME, title="Code Review Report", style=REPORT_STYLE) as report:
+        review_python_files_in_directory(directory_path, ignore_list, report)
 
     end_time = time.time()
     elapsed_time = end_time - start_time
     
-    final_html_content = generate_final_report(reviews_html)
-
-    with open(OUTPUT_REPORT_NAME, 'w') as output_file:
-        output_file.write(final_html_content)
-    
     print(f"Total Time Taken for Review: {elapsed_time:.2f} seconds")
     print(f"Code review report is saved to {OUTPUT_REPORT_NAME}")
+    print(usage.summary())
 
 if __name__ == "__main__":
     main()
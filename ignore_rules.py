@@ -0,0 +1,113 @@
+import fnmatch
+import re
+import shlex
+
+from findings import SECTIONS
+
+# ignore.txt holds one rule per line; "#" starts a comment. A rule is a list of key=value fields
+# that must all match a finding, for example:
+#     category="Code Improvement Suggestions" path=legacy/*.py
+#     message="hard-?coded (password|secret)" lines=10-40
+#     category=bugs path=*/migrations/* lines=7
+# A line without any key=value field is a plain-text phrase matched anywhere in the finding's text.
+RULE_KEYS = ("category", "message", "path", "lines")
+RULE_FIELD = re.compile(r"(?:^|\s)(?:category|message|path|lines)=")
+
+
+def _category(value):
+    """Resolves a section name or an unambiguous prefix of one (case-insensitive), e.g. "bugs" or "security"."""
+    value = value.strip().lower()
+    if not value:
+        raise ValueError(f"empty category; expected one of: {', '.join(SECTIONS)}")
+    exact = [section for section in SECTIONS if section.lower() == value]
+    if exact:
+        return exact[0]
+    matches = [
+        section for section in SECTIONS
+        if section.lower().startswith(value) or section.lower().split()[-1].startswith(value)
+    ]
+    if len(matches) > 1:
+        raise ValueError(f"ambiguous category {value!r}; it matches {', '.join(matches)}")
+    if not matches:
+        raise ValueError(f"unknown category {value!r}; expected one of: {', '.join(SECTIONS)}")
+    return matches[0]
+
+
+def _line_range(value):
+    first, _, last = value.partition("-")
+    first = int(first)
+    last = int(last) if last else first
+    if first > last:
+        raise ValueError(f"line range {value!r} ends before it starts")
+    return first, last
+
+
+def compile_rule(text):
+    """Compiles one ignore.txt line into a rule dict; raises ValueError on an invalid rule."""
+    text = text.strip()
+    if not RULE_FIELD.search(text):
+        phrase = " ".join(text.split("#", 1)[0].split())
+        return {"text": text, "message": re.compile(re.escape(phrase), re.I)} if phrase else None
+    fields = shlex.split(text, comments=True)
+    rule = {"text": text}
+    for field in fields:
+        key, separator, value = field.partition("=")
+        if not separator or key not in RULE_KEYS:
+            raise ValueError(f"unknown field {field!r}; expected {'=, '.join(RULE_KEYS)}=")
+        if key == "category":
+            rule["category"] = _category(value)
+        elif key == "message":
+            try:
+                rule["message"] = re.compile(value, re.I)
+            except re.error as e:
+                raise ValueError(f"invalid message pattern {value!r}: {e}")
+        elif key == "path":
+            rule["path"] = re.compile(fnmatch.translate(value.replace("\\", "/")))
+        else:
+            rule["lines"] = _line_range(value)
+    return rule
+
+
+def load_rules(file_path):
+    """Reads and compiles the ignore rules; invalid lines are reported and skipped."""
+    rules = []
+    with open(file_path, "r") as f:
+        for number, line in enumerate(f, start=1):
+            try:
+                rule = compile_rule(line)
+            except ValueError as e:
+                print(f"Warning: {file_path} line {number} ignored: {e}")
+                continue
+            if rule is not None:
+                rules.append(rule)
+    return rules
+
+
+def matches(rule, finding, file_path):
+    """True if the finding satisfies every field of the rule."""
+    if "category" in rule and finding["section"] != rule["category"]:
+        return False
+    if "lines" in rule and not rule["lines"][0] <= finding["line"] <= rule["lines"][1]:
+        return False
+    if "path" in rule:
+        # The glob may match the whole path or any trailing part of it, e.g. legacy/*.py
+        parts = file_path.replace("\\", "/").split("/")
+        if not any(rule["path"].match("/".join(parts[index:])) for index in range(len(parts))):
+            return False
+    if "message" in rule:
+        text = " ".join((finding["identification"], finding["explanation"], finding["fix"]))
+        if not rule["message"].search(text):
+            return False
+    return True
+
+
+def filter_findings(findings, rules, file_path):
+    """Splits findings into (kept, suppressed) using the compiled ignore rules."""
+    kept = []
+    suppressed = []
+    for finding in findings:
+        if any(matches(rule, finding, file_path) for rule in rules):
+            suppressed.append(finding)
+        else:
+            kept.append(finding)
+    return kept, suppressed
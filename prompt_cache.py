@@ -0,0 +1,33 @@
+import datetime
+
+from batching import estimate_tokens
+
+# Vertex AI only caches prefixes of at least this many tokens (gemini-1.5 models).
+MIN_CACHED_TOKENS = 32768
+CACHE_TTL = datetime.timedelta(hours=1)
+
+
+def build_review_model(model_name, instructions, use_context_cache=True):
+    """Builds a model that carries the static review instructions as its system instruction.
+
+    When the instructions are long enough for the backend to cache, they are stored once as
+    cached content and every request in the run reuses that prefix.
+    """
+    if use_context_cache and estimate_tokens(instructions) >= MIN_CACHED_TOKENS:
+        try:
+            from vertexai.preview import caching
+            from vertexai.preview.generative_models import GenerativeModel as PreviewGenerativeModel
+
+            cached_content = caching.CachedContent.create(
+                model_name=model_name,
+                system_instruction=instructions,
+                ttl=CACHE_TTL,
+            )
+            print(f"Review instructions cached as {cached_content.name}")
+            return PreviewGenerativeModel.from_cached_content(cached_content=cached_content)
+        except Exception as e:
+            print(f"WARNING: Could not cache review instructions ({e}); sending them as system instruction.")
+    from vertexai.generative_models import GenerativeModel
+
+    return GenerativeModel(model_name, system_instruction=[instructions])
+
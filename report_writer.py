@@ -0,0 +1,104 @@
+import os
+import threading
+
+DEFAULT_STYLE = """
+                body { font-family: Arial, sans-serif; margin: 20px; }
+                h1 { color: #34495E; text-align: center; }
+"""
+
+HEADER = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{title}</title>
+    <style>{style}    </style>
+</head>
+<body>
+    <h1>{title}</h1>
+"""
+FOOTER = """</body>
+</html>
+"""
+
+
+class HtmlReportWriter:
+    """Streams report sections to disk while keeping the file a complete HTML document.
+
+    The footer is rewritten after every section and the next section overwrites it, so the
+    report is well-formed after each write and memory does not grow with the number of files.
+    write_section is safe to call from concurrent workers.
+    """
+
+    def __init__(self, path, title="Code Review Summary", style=DEFAULT_STYLE, append=False):
+        self.path = path
+        self.title = title
+        self.style = style
+        self.append = append
+        self.sections = 0
+        self._file = None
+        self._body_end = 0
+        self._lock = threading.Lock()
+
+    def open(self):
+        """Creates the report, or reopens an existing one in append mode, positioned before the footer."""
+        with self._lock:
+            if self._file is not None:
+                return self
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if self.append and os.path.exists(self.path):
+                self._file = open(self.path, "r+b")
+                content = self._file.read()
+                footer_index = content.rfind(FOOTER.encode("utf-8"))
+                self._body_end = len(content) if footer_index == -1 else footer_index
+            else:
+                self._file = open(self.path, "w+b")
+                self._write(HEADER.format(title=self.title, style=self.style))
+                self._body_end = self._file.tell()
+            self._write_footer()
+        return self
+
+    def _write(self, text):
+        self._file.write(text.encode("utf-8"))
+
+    def _write_footer(self):
+        self._file.seek(self._body_end)
+        self._write(FOOTER)
+        self._file.truncate()
+        self._file.flush()
+
+    def write_section(self, html):
+        """Appends one section to the report body and flushes it to disk."""
+        if self._file is None:
+            self.open()
+        with self._lock:
+            self._file.seek(self._body_end)
+            self._write(html)
+            self._write("\n")
+            self._body_end = self._file.tell()
+            self._write_footer()
+            self.sections += 1
+
+    def close(self, closing_html=""):
+        """Writes optional closing content (such as run totals) and finalizes the footer."""
+        if self._file is None:
+            self.open()
+        with self._lock:
+            if closing_html:
+                self._file.seek(self._body_end)
+                self._write(closing_html)
+                self._write("\n")
+                self._body_end = self._file.tell()
+            self._write_footer()
+            self._file.close()
+            self._file = None
+            # Writing after close continues the same report instead of starting over.
+            self.append = True
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
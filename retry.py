@@ -0,0 +1,101 @@
+import random
+import threading
+import time
+
+MAX_ATTEMPTS = 6
+BASE_DELAY = 1.0  # seconds before the first retry, doubled on every attempt
+MAX_DELAY = 60.0
+# Retries shared by every call in a run, so a long outage fails fast instead of stalling for hours.
+MAX_RETRIES_PER_RUN = 200
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+RETRYABLE_GRPC_CODES = {"RESOURCE_EXHAUSTED", "UNAVAILABLE", "DEADLINE_EXCEEDED", "INTERNAL", "ABORTED"}
+RETRYABLE_MESSAGES = ("429", "503", "resource exhausted", "quota", "unavailable", "deadline exceeded", "try again")
+
+
+class RetryBudget:
+    """Thread-safe count of retries left for the whole run."""
+
+    def __init__(self, max_retries=MAX_RETRIES_PER_RUN):
+        self.remaining = max_retries
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Consumes one retry, returning False once the budget is exhausted."""
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            self.used += 1
+            return True
+
+
+run_budget = RetryBudget()
+_last_call = threading.local()
+
+
+def retries_in_last_call():
+    """Number of retries made by the most recent call_with_retry on this thread."""
+    return getattr(_last_call, "retries", 0)
+
+
+def is_retryable(error):
+    """Classifies quota, overload, timeout and connection errors as retryable."""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS_CODES
+    grpc_status = getattr(error, "grpc_status_code", None)
+    if grpc_status is not None:
+        return getattr(grpc_status, "name", str(grpc_status)) in RETRYABLE_GRPC_CODES
+    message = str(error).lower()
+    return any(hint in message for hint in RETRYABLE_MESSAGES)
+
+
+def retry_after_seconds(error):
+    """Returns the server's retry-after hint in seconds, if the error carries one."""
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is not None:
+        return float(retry_after)
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    if "Retry-After" in headers:
+        try:
+            return float(headers["Retry-After"])
+        except ValueError:
+            return None
+    # google.rpc.RetryInfo arrives in the error details of gRPC quota errors.
+    for detail in getattr(error, "details", None) or []:
+        retry_delay = getattr(detail, "retry_delay", None)
+        if retry_delay is not None:
+            return retry_delay.seconds + retry_delay.nanos / 1e9
+    return None
+
+
+def backoff_delay(attempt, base_delay=None, max_delay=None):
+    """Exponential backoff with full jitter for the given 0-based retry attempt."""
+    base_delay = BASE_DELAY if base_delay is None else base_delay
+    max_delay = MAX_DELAY if max_delay is None else max_delay
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def call_with_retry(function, *args, budget=None, max_attempts=MAX_ATTEMPTS, **kwargs):
+    """Calls function, retrying retryable errors with backoff until attempts or the run budget run out."""
+    budget = run_budget if budget is None else budget
+    attempt = 0
+    while True:
+        _last_call.retries = attempt
+        try:
+            return function(*args, **kwargs)
+        except Exception as e:
+            if not is_retryable(e) or attempt + 1 >= max_attempts or not budget.take():
+                raise
+            delay = backoff_delay(attempt)
+            hinted = retry_after_seconds(e)
+            if hinted is not None:
+                delay = max(delay, hinted)
+            print(f"Retryable error ({e}); retrying in {delay:.1f} seconds (attempt {attempt + 2}/{max_attempts})")
+            time.sleep(delay)
+            attempt += 1
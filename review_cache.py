@@ -0,0 +1,155 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+
+CACHE_DIR = ".review_cache"
+CACHE_MAX_BYTES = 256 * 1024 * 1024  # evict least recently used responses beyond this size
+# Eviction frees the cache down to this fraction of the cap, so one directory scan makes room for
+# many writes instead of running again on every put once the cache is full
+CACHE_LOW_WATER = 0.9
+
+
+def cache_key(numbered_code, prompt_text, model_name, generation_config):
+    """Builds a content address from everything that influences the model response."""
+    payload = json.dumps(
+        [numbered_code, prompt_text, model_name, generation_config],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ReviewCache:
+    """On-disk cache of raw model responses with a size cap and LRU eviction."""
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, enabled=True, refresh=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.txt")
+
+    def get(self, key):
+        """Returns the cached response for key, or None on a miss."""
+        if not self.enabled or self.refresh:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as cached_file:
+                text = cached_file.read()
+            # The mtime doubles as the last-used timestamp for eviction.
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return text
+
+    def put(self, key, text):
+        """Stores a response and evicts the least recently used entries if over the cap."""
+        if not self.enabled:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as cached_file:
+            cached_file.write(text)
+        previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_total()
+            else:
+                self._total_bytes += os.path.getsize(path) - previous_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def discard(self, key):
+        """Removes the cached response for key, if any."""
+        path = self._path(key)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes -= size
+
+    def fetch(self, key, generate, parse=None):
+        """Returns the cached response for key, calling generate() and storing its result on a miss.
+
+        With parse, returns parse(response) instead and only stores responses that parse, so a
+        truncated reply is asked for again next time; a cached response that fails to parse is
+        dropped and regenerated.
+        """
+        text = self.get(key)
+        if text is not None and parse is not None:
+            try:
+                return parse(text)
+            except Exception:
+                self.discard(key)
+                text = None
+        if text is None:
+            text = generate()
+            result = parse(text) if parse is not None else text
+            self.put(key, text)
+            return result
+        return text
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for filename in files:
+                if filename.endswith(".txt"):
+                    path = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _scan_total(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes * CACHE_LOW_WATER:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._total_bytes = total
+
+    def stats(self):
+        return f"cache hits: {self.hits}, misses: {self.misses}"
+
+
+def add_cache_arguments(parser):
+    """Adds the --no-cache and --refresh switches to an argument parser."""
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the review cache.")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached reviews but store fresh responses.")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="Directory holding cached model responses.")
+    return parser
+
+
+def cache_from_argv(argv=None):
+    """Builds a ReviewCache from the cache switches on the command line."""
+    parser = add_cache_arguments(argparse.ArgumentParser(add_help=False))
+    args, _ = parser.parse_known_args(argv)
+    return ReviewCache(cache_dir=args.cache_dir, enabled=not args.no_cache, refresh=args.refresh)
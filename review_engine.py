@@ -0,0 +1,38 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Upper bound on model calls in flight at once; keep below the project's QPM quota.
+MAX_IN_FLIGHT = 8
+# Taken around every model call (see telemetry.UsageRecorder.call), so files reviewed in parallel
+# and the chunks of each file share the one bound instead of multiplying their pool sizes.
+model_call_slots = threading.BoundedSemaphore(MAX_IN_FLIGHT)
+
+
+def collect_files(directory_path, extensions):
+    """Walks the directory and returns matching file paths in a stable order."""
+    file_paths = []
+    for root, dirs, files in os.walk(directory_path):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename.endswith(tuple(extensions)):
+                file_paths.append(os.path.join(root, filename))
+    return file_paths
+
+
+def _timed_review(review_file, file_path):
+    start_time = time.time()
+    review = review_file(file_path)
+    elapsed_time = time.time() - start_time
+    print(f"Time taken to review {os.path.basename(file_path)}: {elapsed_time:.2f} seconds")
+    return file_path, review, elapsed_time
+
+
+def review_files(file_paths, review_file, max_in_flight=MAX_IN_FLIGHT):
+    """Reviews files concurrently and yields (file_path, review, elapsed_time) in input order."""
+    max_in_flight = max(1, int(max_in_flight))
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        futures = [executor.submit(_timed_review, review_file, file_path) for file_path in file_paths]
+        for future in futures:
+            yield future.result()
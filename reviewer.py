@@ -0,0 +1,88 @@
+import argparse
+import importlib
+import time
+
+from review_cache import ReviewCache, add_cache_arguments
+from run_journal import RunJournal, add_journal_arguments
+
+# Each profile runs one of the existing review scripts; only the chosen script is imported,
+# and none of them touches Vertex AI until its first model call.
+PROFILES = {
+    "python": {
+        "module": "sreekar",
+        "entry": "main",
+        "cache": True,
+        "journal": True,
+        "help": "Review every .py and .sql file under a directory concurrently (sreekar.py).",
+    },
+    "sql": {
+        "module": "sruthi",
+        "entry": "main",
+        "cache": True,
+        "journal": True,
+        "help": "Review Python and SQL files with language-specific instructions (sruthi.py).",
+    },
+    "changed-files": {
+        "module": "changed_files_review",
+        "entry": "main",
+        "cache": False,
+        "journal": False,
+        "help": "Review the files changed by the last commit under a directory (changed_files_review.py).",
+    },
+    "ignore-list": {
+        "module": "ignore",
+        "entry": "main",
+        "cache": False,
+        "journal": False,
+        "help": "Review Python files, leaving out the issues listed in ignore.txt (ignore.py).",
+    },
+    "comparison": {
+        "module": "code_comparision_SQL_nithin",
+        "entry": "run",
+        "cache": False,
+        "journal": False,
+        "help": "Review SQL files and report only errors that are new since the saved baseline "
+                "(code_comparision_SQL_nithin.py).",
+    },
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Reviews code with Gemini on Vertex AI.")
+    subparsers = parser.add_subparsers(dest="profile", metavar="PROFILE", required=True)
+    for name, profile in PROFILES.items():
+        subparser = subparsers.add_parser(name, help=profile["help"], description=profile["help"])
+        subparser.add_argument("path", nargs="?", help="Directory to review (defaults to the script's own setting).")
+        if name == "comparison":
+            subparser.add_argument(
+                "--mode",
+                choices=["1", "2", "3"],
+                help="1: write the HTML review, 2: save the baseline errors, 3: report only new errors.",
+            )
+        if profile["cache"]:
+            add_cache_arguments(subparser)
+        if profile["journal"]:
+            add_journal_arguments(subparser, default_path=None)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    profile = PROFILES[args.profile]
+    start_time = time.time()
+    module = importlib.import_module(profile["module"])
+    if profile["cache"]:
+        module.review_cache = ReviewCache(cache_dir=args.cache_dir, enabled=not args.no_cache, refresh=args.refresh)
+    if profile["journal"]:
+        module.journal = RunJournal(args.journal or module.JOURNAL_FILE, resume=args.resume)
+
+    kwargs = {"mode": args.mode} if args.profile == "comparison" else {}
+    if args.path:
+        getattr(module, profile["entry"])(args.path, **kwargs)
+    else:
+        getattr(module, profile["entry"])(**kwargs)
+    print(f"Profile {args.profile} finished in {time.time() - start_time:.2f} seconds")
+
+
+if __name__ == "__main__":
+    main()
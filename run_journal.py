@@ -0,0 +1,163 @@
+import argparse
+import hashlib
+import sqlite3
+import threading
+import time
+
+# Reviews that failed come back as text starting with this, not as exceptions
+ERROR_MARKER = "Error generating review:"
+
+PENDING = "pending"
+IN_FLIGHT = "in-flight"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    state TEXT NOT NULL,
+    response TEXT,
+    elapsed REAL,
+    error TEXT,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+def content_hash(code_content):
+    return hashlib.sha256(code_content.encode("utf-8")).hexdigest()
+
+
+class RunJournal:
+    """SQLite journal of per-file review progress, so an interrupted run can be resumed.
+
+    Every state change is committed immediately. The database is opened on first use; without
+    resume it starts empty, with resume files already done with unchanged content are returned
+    from the journal instead of being reviewed again.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.resume = resume
+        self.resumed = 0
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _db(self):
+        # Callers hold self._lock
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(SCHEMA)
+            if not self.resume:
+                self._connection.execute("DELETE FROM files")
+            self._connection.commit()
+        return self._connection
+
+    def _set(self, file_path, code_hash, state, response=None, elapsed=None, error=None):
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO files (path, content_hash, state, response, elapsed, error, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (file_path, code_hash, state, response, elapsed, error, time.time()),
+            )
+            db.commit()
+
+    def _hash_of(self, file_path):
+        with self._lock:
+            row = self._db().execute("SELECT content_hash FROM files WHERE path = ?", (file_path,)).fetchone()
+        return row[0] if row else ""
+
+    def add_pending(self, file_paths):
+        """Records files the run is going to review, keeping the state of files already journaled."""
+        with self._lock:
+            db = self._db()
+            db.executemany(
+                "INSERT OR IGNORE INTO files (path, content_hash, state, updated_at) VALUES (?, '', ?, ?)",
+                [(file_path, PENDING, time.time()) for file_path in file_paths],
+            )
+            db.commit()
+
+    def completed(self, file_path, code_content):
+        """Returns the journaled (response, elapsed) of a file done with this content, or None."""
+        if not self.resume:
+            return None
+        with self._lock:
+            row = self._db().execute(
+                "SELECT response, elapsed FROM files WHERE path = ? AND state = ? AND content_hash = ?",
+                (file_path, DONE, content_hash(code_content)),
+            ).fetchone()
+        if row is None:
+            return None
+        with self._lock:
+            self.resumed += 1
+        return row[0], row[1] or 0.0
+
+    def failed_before(self, file_path):
+        """True if a resumed run's journal has the file as failed, i.e. the report already holds its error."""
+        if not self.resume:
+            return False
+        with self._lock:
+            row = self._db().execute("SELECT state FROM files WHERE path = ?", (file_path,)).fetchone()
+        return row is not None and row[0] == FAILED
+
+    def start(self, file_path, code_content):
+        self._set(file_path, content_hash(code_content), IN_FLIGHT)
+
+    def finish(self, file_path, response, elapsed):
+        """Marks a file done, or failed if the review text reports an error."""
+        if ERROR_MARKER in response:
+            self._set(file_path, self._hash_of(file_path), FAILED, response, elapsed, response)
+        else:
+            self._set(file_path, self._hash_of(file_path), DONE, response, elapsed)
+
+    def fail(self, file_path, error):
+        self._set(file_path, self._hash_of(file_path), FAILED, error=str(error))
+
+    def review(self, file_path, code_content, review):
+        """Returns the journaled review of an unchanged, completed file, or runs review() and journals it."""
+        completed = self.completed(file_path, code_content)
+        if completed is not None:
+            print(f"Resuming: {file_path} was already reviewed, using the journaled review.")
+            return completed[0]
+        self.start(file_path, code_content)
+        start_time = time.time()
+        try:
+            response = review()
+        except Exception as e:
+            self.fail(file_path, e)
+            raise
+        self.finish(file_path, response, time.time() - start_time)
+        return response
+
+    def counts(self):
+        with self._lock:
+            rows = self._db().execute("SELECT state, COUNT(*) FROM files GROUP BY state").fetchall()
+        return dict(rows)
+
+    def stats(self):
+        counts = self.counts()
+        states = ", ".join(f"{state}: {counts.get(state, 0)}" for state in (DONE, FAILED, IN_FLIGHT, PENDING))
+        return f"journal {self.path} - {states} (resumed from journal: {self.resumed})"
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+def add_journal_arguments(parser, default_path):
+    """Adds the --resume and --journal switches to an argument parser."""
+    parser.add_argument("--resume", action="store_true", help="Skip files the interrupted run already reviewed.")
+    parser.add_argument("--journal", default=default_path, help="SQLite file recording per-file progress.")
+    return parser
+
+
+def journal_from_argv(default_path, argv=None):
+    """Builds a RunJournal from the journal switches on the command line."""
+    parser = add_journal_arguments(argparse.ArgumentParser(add_help=False), default_path)
+    args, _ = parser.parse_known_args(argv)
+    return RunJournal(args.journal, resume=args.resume)
@@ -1,7 +1,16 @@
 import os
+import threading
 import time
-import vertexai
-from vertexai.generative_models import GenerativeModel, SafetySetting, HarmCategory, HarmBlockThreshold
+from chunking import review_in_chunks
+from duplicates import duplicate_findings, duplicate_section_html, find_clones
+from findings import parse_findings, structured_generation_config, structured_prompt
+from prompt_cache import build_review_model
+from report_writer import HtmlReportWriter
+from review_cache import cache_from_argv, cache_key
+from run_journal import journal_from_argv
+from syntax_check import check_files, model_sections, prompt_note, syntax_section_html
+from telemetry import UsageRecorder, collect_stream
+from vertex_client import LazyModel, block_only_high_safety_settings, init_vertex
 
 
 # Input Variables
@@ -10,12 +19,14 @@ PROJECT_ID = "cedar-context-433909-d9"
 LOCATION ='us-west4'
 GENERATIVE_MODEL_NAME = "gemini-1.5-flash-001"
 OUTPUT_FILE = "C:\\vertexai_task\\final_python_response.html"
+INPUT_DIRECTORY = "C:\\vertexai_task\\pyfiles"
+JOURNAL_FILE = os.path.splitext(OUTPUT_FILE)[0] + "_journal.sqlite3"
+# Duplicate Code is found locally across all files and shown as section 5, after the local Syntax Errors
+# table and the model's three sections (the model's four when a file could not be checked locally)
+DUPLICATE_SECTION_NUMBER = 5
 
-# Set your Google Cloud credentials
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = GOOGLE_APPLICATION_CREDENTIALS
-
-# Initialize Vertex AI with your project details
-vertexai.init(project=PROJECT_ID, location=LOCATION)
+# Streams each review to disk while keeping the report a complete HTML document
+report = HtmlReportWriter(OUTPUT_FILE, title="Code Review Report", append=True)
 
 generation_config = {
     "max_output_tokens": 8192,
@@ -23,26 +34,16 @@ generation_config = {
     "top_p": 0.25,
 }
 
-safety_settings = [
-    SafetySetting(
-        category=HarmCategory.HARM_CATEGORY_HATE_SPEECH,
-        threshold=HarmBlockThreshold.BLOCK_ONLY_HIGH
-    ),
-    SafetySetting(
-        category=HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT,
-        threshold=HarmBlockThreshold.BLOCK_ONLY_HIGH
-    ),
-    SafetySetting(
-        category=HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT,
-        threshold=HarmBlockThreshold.BLOCK_ONLY_HIGH
-    ),
-    SafetySetting(
-        category=HarmCategory.HARM_CATEGORY_HARASSMENT,
-        threshold=HarmBlockThreshold.BLOCK_ONLY_HIGH
-    ),
-]
-
-generative_model = GenerativeModel(GENERATIVE_MODEL_NAME)
+# One model per language, each carrying its review instructions as the system instruction
+review_models = {}
+review_models_lock = threading.Lock()
+# Chunks of long files are reviewed as JSON findings by a model without the HTML instructions
+findings_model = LazyModel(GENERATIVE_MODEL_NAME, PROJECT_ID, LOCATION, GOOGLE_APPLICATION_CREDENTIALS)
+# Prints prompt/output tokens per request and writes them to review_usage.jsonl
+usage = UsageRecorder(verbose=True)
+review_cache = cache_from_argv()
+# Per-file progress; --resume skips files whose review an interrupted run already appended
+journal = journal_from_argv(JOURNAL_FILE)
 
 
 def read_file_content(file_path):
@@ -51,41 +52,82 @@ def read_file_content(file_path):
         return file.read()
 
 
-def add_line_numbers(code_content):
-    """Adds line numbers to code content for better error referencing."""
-    lines = code_content.split('\n')
-    numbered_lines = [f"Line {i + 1}: {line}" for i, line in enumerate(lines)]
-    return '\n'.join(numbered_lines)
-
-
-def generate_review(file_path, file_type):
-    """Generate the review using the AI model based on file type."""
+def generate_review(file_path, file_type, syntax_result, duplicates):
+    """Generate the review using the AI model based on file type; syntax errors and duplicates come from local pre-passes."""
     code_content = read_file_content(file_path)
-    numbered_code_content = add_line_numbers(code_content)
-    
-    if file_type == "py":
-        prompt = create_prompt(numbered_code_content, "Python")
-    elif file_type == "sql":
-        prompt = create_prompt(numbered_code_content, "SQL")
-    
-    response_text = ""
+    language = "Python" if file_type == "py" else "SQL"
+    note = prompt_note(syntax_result)
+    sections, start = model_sections(syntax_result)
+    return syntax_section_html(syntax_result) + review_in_chunks(
+        code_content,
+        file_type,
+        lambda numbered_code: review_numbered_code(numbered_code, language, file_path, note),
+        lambda numbered_code: generate_findings(numbered_code, f"You are reviewing {language} code.\n{note}", file_path),
+        sections,
+        start,
+    ) + duplicate_section_html(duplicates, DUPLICATE_SECTION_NUMBER)
+
+
+def generate_findings(numbered_code_content, note="", label="review"):
+    """Reviews one chunk of a long file as JSON findings (see findings.RESPONSE_SCHEMA), so chunks can be merged."""
+    from vertexai.generative_models import GenerationConfig
+
+    prompt = structured_prompt(numbered_code_content, note)
+    config = structured_generation_config(generation_config)
+    key = cache_key(numbered_code_content, prompt, GENERATIVE_MODEL_NAME, config)
+    return review_cache.fetch(
+        key,
+        lambda: usage.call(label, GENERATIVE_MODEL_NAME, findings_model.generate_content, prompt,
+                           generation_config=GenerationConfig(**config),
+                           safety_settings=block_only_high_safety_settings()).text,
+        parse_findings,
+    )
+
+
+def get_review_model(language):
+    """Returns the model for a language, initializing Vertex AI and building the model on first use."""
+    with review_models_lock:
+        if language not in review_models:
+            init_vertex(PROJECT_ID, LOCATION, GOOGLE_APPLICATION_CREDENTIALS)
+            review_models[language] = build_review_model(GENERATIVE_MODEL_NAME, review_instructions(language))
+        return review_models[language]
+
+
+def review_numbered_code(numbered_code_content, language, label="review", note=""):
+    """Reviews one block of line-numbered code."""
+    prompt = create_prompt(numbered_code_content, note)
+    key = cache_key(numbered_code_content, review_instructions(language) + prompt, GENERATIVE_MODEL_NAME, generation_config)
     try:
-        responses = generative_model.generate_content(
-            [prompt],
-            generation_config=generation_config,
-            safety_settings=safety_settings,
-            stream=True,
+        response_text = review_cache.fetch(
+            key,
+            lambda: usage.call(label, GENERATIVE_MODEL_NAME, stream_review, prompt, language).text,
         )
-        for response in responses:
-            response_text += response.text
     except Exception as e:
         response_text = f"Error generating review: {str(e)}"
     
     return response_text
 
 
-def create_prompt(code_content, language):
-    """Creates a dynamic prompt for code review based on the language."""
+def stream_review(prompt, language):
+    """Streams the model response for a prompt and returns it with the full text collected."""
+    responses = get_review_model(language).generate_content(
+        [prompt],
+        generation_config=generation_config,
+        safety_settings=block_only_high_safety_settings(),
+        stream=True,
+    )
+    return collect_stream(responses)
+
+
+def create_prompt(code_content, note=""):
+    """Creates the per-file part of the prompt; the instructions travel as the system instruction."""
+    return f"""{note}**The Code:**
+{code_content}
+"""
+
+
+def review_instructions(language):
+    """Creates the static review instructions for the language."""
     return f"""
 You are an {language} expert.  
 Please analyze the provided code snippet and provide the following information:
@@ -108,12 +150,7 @@ Please analyze the provided code snippet and provide the following information:
     - **Fix**: Suggest code changes to mitigate the security risks without rewriting the entire code.
     - **Note**: If no security vulnerabilities are found, generate a table with "No Security Vulnerabilities Found" in normal font (Times New Roman).
 
-4. **Duplicate Code:**
-    - **Identification**: Highlight sections of the code lines that are duplicated.
-    - **Suggestion**: Provide recommendations without rewriting the entire code.
-    - **Note**: If no duplicate code is found, generate a table with "No duplicate code in this file" in normal font (Times New Roman).
-
-5. **Code Improvement Suggestions:**
+4. **Code Improvement Suggestions:**
     - **Identification**: Highlight sections of the code that can be improved.
         - This could include:
         - Unnecessary complexity
@@ -122,9 +159,9 @@ Please analyze the provided code snippet and provide the following information:
     - **Suggestion**: Provide specific points for improvement and the necessary code changes without rewriting the entire code.
     - **Note**: If no code improvement suggestions are found, generate a table with "No Code Improvement Suggestions Found" in normal font (Times New Roman).
 
-6. **Don't write any kind of code or code snippet in the output.**
+5. **Don't write any kind of code or code snippet in the output.**
 
-7. Generate the output in a purely HTML format so that the file can be opened and displayed as a proper web page.
+6. Generate the output in a purely HTML format so that the file can be opened and displayed as a proper web page.
    - Format the entire output in **HTML** with consistent table formatting for each section.
    - Strictly do not give any headings for review response of file.
    - Ensure there is no "File: Untitled" or "code analysis report" headings in the final output.
@@ -135,15 +172,12 @@ Please analyze the provided code snippet and provide the following information:
         - Ensure uniform font style (Times New Roman) and table alignment throughout.
    - Make sure that line number is present in identification column itself(no more column containing line numbers)
    - ensure that Identification, Explanation and Fix are the column names for Syntax Errors, Code Bugs, Security Vulnerabilities sections
-     and Identification, suggestion are the only column names for Duplicate Code, and Code Improvement Suggestions.
+     and Identification, suggestion are the only column names for Code Improvement Suggestions.
         - note: strictly no other columns are allowed.
 
-8. Headings like Syntax Errors, Code Bugs, Security Vulnerabilities, Duplicate Code, and Code Improvement Suggestions must be bold and numbered.
+7. Headings like Syntax Errors, Code Bugs, Security Vulnerabilities, and Code Improvement Suggestions must be bold and numbered.
     - Ensure the content, such as "No Syntax Errors Found," is in normal font (Times New Roman).
     - Keep headings and content in distinct fonts.
-
-**The Code:**
-{code_content}
 """
 
 
@@ -157,10 +191,13 @@ def format_time(time_taken):
         return f"{minutes} minutes {seconds:.2f} seconds"
 
 
-def append_to_output_file(content, file_name, file_path, time_taken):
+def append_to_output_file(content, file_name, file_path, time_taken, supersedes=False):
     """Append content to the output file as HTML with proper formatting."""
-    with open(OUTPUT_FILE, "a", encoding="utf-8") as output_file:
-        output_file.write(f"""
+    streaming = usage.stream_summary(file_path)
+    streaming_line = f"<br>\n                Streaming: <strong>{streaming}</strong>" if streaming else ""
+    # The report is append-only, so a failed attempt's section stays above its retry
+    superseded_line = "<br>\n                <em>This review supersedes the failed review of this file earlier in the report.</em>" if supersedes else ""
+    report.write_section(f"""
         <div style='border: 2px solid #3498db; padding: 20px; margin: 20px 0; border-radius: 5px; background-color: #ecf0f1;'>
             <p style='font-family:verdana; font-size: 25px; color: blue;'>
                 <strong>Code Review Report for <strong>{file_name}</strong>
@@ -168,37 +205,55 @@ def append_to_output_file(content, file_name, file_path, time_taken):
             <p style='font-family:verdana; font-size: 18px; color: #34495e;'>
                 File Name: <strong>{file_name}</strong><br>
                 File Path: <strong>{file_path}</strong><br>
-                Time Taken for Review: <strong>{format_time(time_taken)}</strong>
+                Time Taken for Review: <strong>{format_time(time_taken)}</strong>{streaming_line}{superseded_line}
             </p>
             {content}
         </div>
         """)
 
-def main():
+def main(path=INPUT_DIRECTORY):
     """Main function to run code reviews automatically for Python and SQL files."""
-    path = "C:\\vertexai_task\\pyfiles"
     total_time = 0  # To keep track of the total time for all files
 
     def read_and_review_file(file_path, file_name, file_type):
+        code_content = read_file_content(file_path)
+        if journal.completed(file_path, code_content) is not None:
+            # The report is appended to, so its section is already there from the interrupted run
+            print(f"Skipping {file_name}: already reviewed before the run was interrupted.")
+            return 0
+        retried = journal.failed_before(file_path)
+        journal.start(file_path, code_content)
+
         start_time = time.time()  # Start timing before the review starts
-        review = generate_review(file_path, file_type)
+        review = generate_review(file_path, file_type, syntax_results[file_path], duplicates[file_path])
         end_time = time.time()  # End timing after the review finishes
 
         time_taken = end_time - start_time  # Time taken for this specific file
-        append_to_output_file(review, file_name, file_path, time_taken)  # Include time taken in the output
+        append_to_output_file(review, file_name, file_path, time_taken, retried)  # Include time taken in the output
+        journal.finish(file_path, review, time_taken)
         print(f"Review for {file_name} appended to {OUTPUT_FILE}. Time taken: {format_time(time_taken)}.")
         return time_taken
 
+    files = []
     for dirpath, _, filenames in os.walk(path):
         for file in filenames:
             if file.endswith(".py"):
-                file_path = os.path.join(dirpath, file)
-                total_time += read_and_review_file(file_path, file, "py")
+                files.append((os.path.join(dirpath, file), file, "py"))
             elif file.endswith(".sql"):
-                file_path = os.path.join(dirpath, file)
-                total_time += read_and_review_file(file_path, file, "sql")
+                files.append((os.path.join(dirpath, file), file, "sql"))
+
+    # Local syntax check and cross-file duplicate detection over a process pool before any model call
+    file_paths = [file_path for file_path, _, _ in files]
+    syntax_results = check_files(file_paths)
+    duplicates = duplicate_findings(find_clones(file_paths))
+    for file_path, file, file_type in files:
+        total_time += read_and_review_file(file_path, file, file_type)
 
+    report.close()
     print(f"Total time taken for all reviews: {format_time(total_time)}.")
+    print(review_cache.stats())
+    print(journal.stats())
+    print(usage.summary())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,157 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from findings import MODEL_SECTIONS, render_findings_html
+
+try:
+    import sqlglot
+    from sqlglot.errors import SqlglotError
+except ImportError:  # SQL files are then left to the model
+    sqlglot = None
+
+SQL_DIALECT = "bigquery"
+PRE_PASS_WORKERS = os.cpu_count() or 1
+# Below this many files a process pool costs more to start than it saves
+MIN_FILES_FOR_POOL = 16
+
+CLEAN = "clean"
+ERRORS = "errors"
+UNCHECKED = "unchecked"
+
+CLEAN_NOTE = """Note: this file was parsed locally with {checker} and has no syntax errors.
+Leave out the Syntax Errors section; it is reported separately.
+"""
+ERRORS_NOTE = """Note: this file was parsed locally with {checker} and its syntax errors are reported separately.
+Leave out the Syntax Errors section and review the rest of the code.
+"""
+# sqlglot does not know all of BigQuery (scripting such as IF ... THEN ... END IF fails to parse),
+# so where it stops is only passed on to the model, which still reviews the file's syntax
+SQL_HINT_NOTE = """Note: a local parse with {checker} stopped at the lines below. The parser does not support
+all BigQuery syntax, so decide yourself whether these are real syntax errors:
+{hints}
+"""
+REQUIRED_KEYWORD = re.compile(r"Required keyword: '(\w+)' missing for <class '(?:\w+\.)*(\w+)'>")
+
+
+def syntax_finding(line, identification, explanation, fix):
+    return {
+        "file": "",
+        "section": "Syntax Errors",
+        "line": line or 0,
+        "identification": identification,
+        "explanation": explanation,
+        "fix": fix,
+        "criticality": "High",
+    }
+
+
+def python_syntax_errors(code_content, file_path="<file>"):
+    """Compiles Python source without running it and returns its syntax error as findings."""
+    try:
+        compile(code_content, file_path, "exec", dont_inherit=True)
+    except SyntaxError as e:
+        statement = (e.text or "").strip()
+        return [syntax_finding(
+            e.lineno,
+            f"{type(e).__name__}: {e.msg}",
+            f"Python cannot parse this line{f': {statement}' if statement else ''}.",
+            "Correct the statement so the file compiles.",
+        )]
+    except ValueError as e:
+        return [syntax_finding(1, str(e), "The file cannot be compiled.", "Remove the invalid characters.")]
+    return []
+
+
+def readable_sql_error(description):
+    """Rewords sqlglot's internal parse error text, e.g. "Required keyword: 'this' missing for <class ...If'>"."""
+    match = REQUIRED_KEYWORD.search(description or "")
+    if match:
+        return f"Incomplete {match.group(2).upper()}: the parser expected more after it"
+    if not description or description.startswith("Invalid expression / Unexpected token"):
+        return "Unexpected token"
+    return description.split("\n", 1)[0]
+
+
+def sql_syntax_errors(code_content):
+    """Parses SQL with sqlglot and returns where it failed as findings.
+
+    These are hints rather than errors, since sqlglot fails on some valid BigQuery; check_file
+    leaves such files UNCHECKED and prompt_note passes the hints to the model.
+    """
+    try:
+        sqlglot.parse(code_content, read=SQL_DIALECT)
+    except SqlglotError as e:
+        return [
+            syntax_finding(
+                error.get("line"),
+                readable_sql_error(error.get("description")) + (f" near {error['highlight']!r}" if error.get("highlight") else ""),
+                f"{SQL_DIALECT} SQL could not be parsed near: {error.get('highlight') or ''}".strip(),
+                "Check the statement; the parser does not support all BigQuery syntax.",
+            )
+            for error in getattr(e, "errors", [])
+        ] or [syntax_finding(0, str(e).split("\n", 1)[0], "The SQL could not be parsed.", "Check the statement.")]
+    return []
+
+
+def check_file(file_path):
+    """Returns (file_path, status, checker, findings) for one file; runs in a worker process."""
+    try:
+        with open(file_path, "r", encoding="utf-8") as file:
+            code_content = file.read()
+    except (OSError, UnicodeDecodeError):
+        return file_path, UNCHECKED, "", []
+    if file_path.endswith(".py"):
+        findings, checker = python_syntax_errors(code_content, file_path), "the Python compiler"
+    elif file_path.endswith(".sql") and sqlglot is not None:
+        findings, checker = sql_syntax_errors(code_content), f"sqlglot ({SQL_DIALECT} dialect)"
+    else:
+        return file_path, UNCHECKED, "", []
+    for finding in findings:
+        finding["file"] = file_path
+    if findings and file_path.endswith(".sql"):
+        # Only hints; the model still reviews the syntax of SQL that sqlglot could not parse
+        return file_path, UNCHECKED, checker, findings
+    return file_path, ERRORS if findings else CLEAN, checker, findings
+
+
+def check_files(file_paths, max_workers=PRE_PASS_WORKERS):
+    """Checks every file locally, over a process pool for large runs; returns {file_path: result}."""
+    if len(file_paths) < MIN_FILES_FOR_POOL or max_workers <= 1:
+        return {file_path: check_file(file_path) for file_path in file_paths}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(check_file, file_paths, chunksize=max(1, len(file_paths) // (max_workers * 4)))
+        return {result[0]: result for result in results}
+
+
+def prompt_note(result):
+    """Tells the model what the local pre-pass already covered or where an unsure SQL parse stopped;
+    empty when the file was not checked.
+    """
+    _, status, checker, findings = result
+    if status == CLEAN:
+        return CLEAN_NOTE.format(checker=checker)
+    if status == ERRORS:
+        return ERRORS_NOTE.format(checker=checker)
+    if findings:
+        hints = "\n".join(
+            f"- Line {finding['line']}: {finding['identification']}" if finding["line"] else f"- {finding['identification']}"
+            for finding in findings
+        )
+        return SQL_HINT_NOTE.format(checker=checker, hints=hints)
+    return ""
+
+
+def model_sections(result):
+    """Returns (sections, first number) the model's review is rendered with, after the local Syntax Errors table."""
+    if result[1] == UNCHECKED:
+        return MODEL_SECTIONS, 1
+    return [section for section in MODEL_SECTIONS if section != "Syntax Errors"], 2
+
+
+def syntax_section_html(result):
+    """Renders the locally found syntax errors as the report's Syntax Errors table, or "" if unchecked."""
+    _, status, _, findings = result
+    if status == UNCHECKED:
+        return ""
+    return render_findings_html(findings, sections=["Syntax Errors"])
@@ -0,0 +1,114 @@
+import argparse
+import os
+import random
+
+# (share of files, min lines, max lines): lots of tiny modules, a long tail of big jobs
+SIZE_MIX = [
+    (0.45, 5, 40),
+    (0.35, 40, 400),
+    (0.15, 400, 1500),
+    (0.05, 1500, 5000),
+]
+SQL_SHARE = 0.3
+
+PYTHON_FUNCTION = '''def transform_{n}(df, column="col_{n}"):
+    """Applies transformation {n} to a dataframe column."""
+    values = df[column].fillna("")
+    cleaned = [value.strip().upper() for value in values]
+    if len(cleaned) > {n}:
+        print("large batch", len(cleaned))
+    df[column] = cleaned
+    return df
+
+'''
+
+PYTHON_CLASS = '''class Job{n}:
+    def __init__(self, spark, source="raw.table_{n}"):
+        self.spark = spark
+        self.source = source
+
+    def run(self):
+        frame = self.spark.sql(f"SELECT * FROM {{self.source}}")
+        return frame.filter("id IS NOT NULL").count()
+
+'''
+
+SQL_STATEMENT = '''-- step {n}
+CREATE OR REPLACE TABLE staging.table_{n} AS
+SELECT id,
+       TRIM(UPPER(name)) AS name,
+       SAFE_CAST(amount AS NUMERIC) AS amount,
+       CURRENT_TIMESTAMP() AS loaded_at
+FROM raw.source_{n}
+WHERE id IS NOT NULL;
+
+'''
+
+
+def _pick_lines(rng):
+    roll = rng.random()
+    for share, low, high in SIZE_MIX:
+        if roll < share:
+            return rng.randint(low, high)
+        roll -= share
+    return SIZE_MIX[-1][2]
+
+
+def python_source(target_lines, rng):
+    """Builds Python source of roughly target_lines lines out of functions and classes."""
+    parts = ["import os\nimport sys\n\n"]
+    lines = 3
+    n = 0
+    while lines < target_lines:
+        block = (PYTHON_CLASS if rng.random() < 0.3 else PYTHON_FUNCTION).format(n=n)
+        parts.append(block)
+        lines += block.count("\n")
+        n += 1
+    return "".join(parts)
+
+
+def sql_source(target_lines, rng):
+    """Builds a SQL script of roughly target_lines lines out of CREATE TABLE AS statements."""
+    parts = []
+    lines = 0
+    n = 0
+    while lines < target_lines:
+        block = SQL_STATEMENT.format(n=n)
+        parts.append(block)
+        lines += block.count("\n")
+        n += 1
+    return "".join(parts)
+
+
+def generate_corpus(output_dir, file_count, seed=0):
+    """Writes file_count Python/SQL files of varied sizes to output_dir and returns their paths."""
+    rng = random.Random(seed)
+    paths = []
+    for index in range(file_count):
+        package_dir = os.path.join(output_dir, f"package_{index // 50:03d}")
+        os.makedirs(package_dir, exist_ok=True)
+        target_lines = _pick_lines(rng)
+        if rng.random() < SQL_SHARE:
+            file_path = os.path.join(package_dir, f"view_{index:05d}.sql")
+            content = sql_source(target_lines, rng)
+        else:
+            file_path = os.path.join(package_dir, f"module_{index:05d}.py")
+            content = python_source(target_lines, rng)
+        with open(file_path, "w") as corpus_file:
+            corpus_file.write(content)
+        paths.append(file_path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Python/SQL corpus for benchmarks.")
+    parser.add_argument("output_dir")
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    paths = generate_corpus(args.output_dir, args.files, args.seed)
+    print(f"Wrote {len(paths)} files to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
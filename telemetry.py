@@ -0,0 +1,238 @@
+import csv
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+from batching import estimate_tokens
+from retry import call_with_retry, retries_in_last_call
+from review_engine import model_call_slots
+
+USAGE_FILE = "review_usage.jsonl"
+# USD per million tokens (input, output) for prompts up to 128k tokens; update when pricing changes.
+PRICES_PER_MILLION_TOKENS = {
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+}
+# Cached prefix tokens are billed at a quarter of the input price.
+CACHED_TOKEN_DISCOUNT = 0.25
+FIELDS = [
+    "timestamp", "label", "model", "prompt_tokens", "cached_tokens", "output_tokens",
+    "wall_time", "finish_reason", "retries", "cost_usd",
+    "time_to_first_chunk", "max_chunk_gap", "mean_chunk_gap", "chunks", "tokens_per_second",
+]
+STREAM_FIELDS = ["time_to_first_chunk", "max_chunk_gap", "mean_chunk_gap", "chunks", "tokens_per_second"]
+
+
+def estimate_cost(model_name, prompt_tokens, output_tokens, cached_tokens=0):
+    """Estimates the cost of one call in USD from its token counts."""
+    for prefix, (input_price, output_price) in PRICES_PER_MILLION_TOKENS.items():
+        if model_name.startswith(prefix):
+            billed_input = prompt_tokens - cached_tokens + cached_tokens * CACHED_TOKEN_DISCOUNT
+            return (billed_input * input_price + output_tokens * output_price) / 1_000_000
+    return 0.0
+
+
+def finish_reason(response):
+    """Returns the finish reason name of a response's first candidate, if any."""
+    candidates = getattr(response, "candidates", None) or []
+    if not candidates:
+        return ""
+    reason = getattr(candidates[0], "finish_reason", "")
+    return getattr(reason, "name", str(reason or ""))
+
+
+def stream_metrics(start_time, chunk_times, output_tokens):
+    """Time to first chunk, gaps between chunks and generation speed of one streamed response.
+
+    Time to first chunk is mostly network and queueing delay; the gaps and tokens per second
+    after it measure generation itself.
+    """
+    if not chunk_times:
+        return {}
+    gaps = [later - earlier for earlier, later in zip(chunk_times, chunk_times[1:])]
+    generation_time = chunk_times[-1] - chunk_times[0]
+    return {
+        "time_to_first_chunk": round(chunk_times[0] - start_time, 3),
+        "max_chunk_gap": round(max(gaps), 3) if gaps else 0.0,
+        "mean_chunk_gap": round(sum(gaps) / len(gaps), 3) if gaps else 0.0,
+        "chunks": len(chunk_times),
+        "tokens_per_second": round(output_tokens / generation_time, 1) if generation_time > 0 else 0.0,
+    }
+
+
+def collect_stream(responses):
+    """Consumes a streamed response and returns one response-like object with the full text.
+
+    The final chunk carries usage_metadata and the finish reason for the whole request. The
+    request is sent when the stream is first iterated, so timing starts here.
+    """
+    start_time = time.time()
+    chunk_times = []
+    text = ""
+    last = None
+    for response in responses:
+        chunk_times.append(time.time())
+        text += response.text
+        last = response
+    usage_metadata = getattr(last, "usage_metadata", None)
+    output_tokens = getattr(usage_metadata, "candidates_token_count", 0) or estimate_tokens(text)
+    return SimpleNamespace(
+        text=text,
+        usage_metadata=usage_metadata,
+        candidates=getattr(last, "candidates", None) or [],
+        stream_metrics=stream_metrics(start_time, chunk_times, output_tokens),
+    )
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def format_stream_metrics(metrics):
+    """One-line description of streaming metrics for logs and report headers."""
+    return (f"first chunk after {metrics['time_to_first_chunk']:.2f} seconds, "
+            f"longest gap {metrics['max_chunk_gap']:.2f} seconds, "
+            f"{metrics['tokens_per_second']:.1f} tokens/s over {metrics['chunks']} chunks")
+
+
+class UsageRecorder:
+    """Records tokens, wall time, finish reason, retries and cost of every model call.
+
+    Each record is appended to a JSONL file (or CSV when the path ends in .csv) as soon as the
+    call finishes, so a crashed run still leaves its usage behind.
+    """
+
+    def __init__(self, path=USAGE_FILE, verbose=False):
+        self.path = path
+        self.verbose = verbose
+        self.records = []
+        self._lock = threading.Lock()
+        self._file = None
+        self._csv_writer = None
+
+    def _open(self):
+        self._file = open(self.path, "a", newline="", encoding="utf-8")
+        if self.path.endswith(".csv"):
+            self._csv_writer = csv.DictWriter(self._file, fieldnames=FIELDS)
+            if self._file.tell() == 0:
+                self._csv_writer.writeheader()
+
+    def record(self, label, model_name, usage_metadata, wall_time, reason="", retries=0, metrics=None):
+        prompt_tokens = getattr(usage_metadata, "prompt_token_count", 0) or 0
+        cached_tokens = getattr(usage_metadata, "cached_content_token_count", 0) or 0
+        output_tokens = getattr(usage_metadata, "candidates_token_count", 0) or 0
+        record = {
+            "timestamp": round(time.time(), 3),
+            "label": label,
+            "model": model_name,
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "output_tokens": output_tokens,
+            "wall_time": round(wall_time, 3),
+            "finish_reason": reason,
+            "retries": retries,
+            "cost_usd": round(estimate_cost(model_name, prompt_tokens, output_tokens, cached_tokens), 6),
+        }
+        for field in STREAM_FIELDS:
+            record[field] = (metrics or {}).get(field)
+        with self._lock:
+            self.records.append(record)
+            if self._file is None:
+                self._open()
+            if self._csv_writer is not None:
+                self._csv_writer.writerow(record)
+            else:
+                self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+        if self.verbose:
+            print(f"Usage for {label}: {prompt_tokens} prompt tokens ({cached_tokens} cached), "
+                  f"{output_tokens} output tokens, {wall_time:.2f} seconds")
+            if metrics:
+                print(f"Streaming for {label}: {format_stream_metrics(metrics)}")
+        return record
+
+    def call(self, label, model_name, function, *args, **kwargs):
+        """Calls function through call_with_retry and records the response's usage.
+
+        The call waits for one of review_engine's MAX_IN_FLIGHT model call slots.
+        """
+        start_time = time.time()
+        try:
+            with model_call_slots:
+                response = call_with_retry(function, *args, **kwargs)
+        except Exception as e:
+            self.record(label, model_name, None, time.time() - start_time, f"ERROR: {type(e).__name__}", retries_in_last_call())
+            raise
+        self.record(label, model_name, getattr(response, "usage_metadata", None), time.time() - start_time,
+                    finish_reason(response), retries_in_last_call(), getattr(response, "stream_metrics", None))
+        return response
+
+    def stream_summary(self, label):
+        """Streaming metrics of the calls made for one label, or "" if none of them streamed.
+
+        Files reviewed in several chunks report their slowest first chunk and longest gap.
+        """
+        with self._lock:
+            records = [r for r in self.records if r["label"] == label and r["chunks"]]
+        if not records:
+            return ""
+        generation_time = sum(r["output_tokens"] / r["tokens_per_second"] for r in records if r["tokens_per_second"])
+        output_tokens = sum(r["output_tokens"] for r in records if r["tokens_per_second"])
+        return format_stream_metrics({
+            "time_to_first_chunk": max(r["time_to_first_chunk"] for r in records),
+            "max_chunk_gap": max(r["max_chunk_gap"] for r in records),
+            "chunks": sum(r["chunks"] for r in records),
+            "tokens_per_second": output_tokens / generation_time if generation_time else 0.0,
+        })
+
+    def summary(self, top=5):
+        """Returns a printable summary: totals, latency percentiles and the most expensive labels."""
+        with self._lock:
+            records = list(self.records)
+        if not records:
+            return "No model calls recorded."
+        wall_times = [r["wall_time"] for r in records]
+        cost_by_label = defaultdict(float)
+        for r in records:
+            cost_by_label[r["label"]] += r["cost_usd"]
+        lines = [
+            f"Model calls: {len(records)} "
+            f"(errors: {sum(1 for r in records if r['finish_reason'].startswith('ERROR'))}, "
+            f"retries: {sum(r['retries'] for r in records)})",
+            f"Tokens: {sum(r['prompt_tokens'] for r in records)} prompt "
+            f"({sum(r['cached_tokens'] for r in records)} cached), "
+            f"{sum(r['output_tokens'] for r in records)} output",
+            f"Estimated cost: ${sum(r['cost_usd'] for r in records):.4f}",
+            f"Wall time per call: p50 {percentile(wall_times, 0.50):.2f}s, "
+            f"p95 {percentile(wall_times, 0.95):.2f}s, max {max(wall_times):.2f}s",
+        ]
+        streamed = [r for r in records if r["chunks"]]
+        if streamed:
+            first_chunk = [r["time_to_first_chunk"] for r in streamed]
+            gaps = [r["max_chunk_gap"] for r in streamed]
+            speeds = [r["tokens_per_second"] for r in streamed if r["tokens_per_second"]]
+            lines.append(f"Time to first chunk: p50 {percentile(first_chunk, 0.50):.2f}s, "
+                         f"p95 {percentile(first_chunk, 0.95):.2f}s, max {max(first_chunk):.2f}s")
+            lines.append(f"Longest chunk gap: p50 {percentile(gaps, 0.50):.2f}s, p95 {percentile(gaps, 0.95):.2f}s")
+            lines.append(f"Generation speed: p50 {percentile(speeds, 0.50):.1f} tokens/s, "
+                         f"p5 {percentile(speeds, 0.05):.1f} tokens/s")
+        lines.append("Most expensive:")
+        for label, cost in sorted(cost_by_label.items(), key=lambda item: item[1], reverse=True)[:top]:
+            lines.append(f"  ${cost:.4f}  {label}")
+        lines.append(f"Usage records written to {self.path}")
+        return "\n".join(lines)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._csv_writer = None
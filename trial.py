@@ -1,19 +1,33 @@
 import os
-import vertexai
-from vertexai.generative_models import GenerativeModel
 import time
+from chunking import review_in_chunks
+from duplicates import duplicate_findings, duplicate_section_html, find_clones
+from findings import parse_findings, structured_generation_config, structured_prompt
+from review_cache import cache_from_argv, cache_key
+from report_writer import HtmlReportWriter
+from review_engine import collect_files, review_files
+from telemetry import UsageRecorder
+from vertex_client import LazyModel
 from bs4 import BeautifulSoup
 
 GOOGLE_APPLICATION_CREDENTIALS = "credentials_file.json"
 PROJECT_ID = "cedar-context-433909-d9"
 LOCATION = "us-central1"
 GENERATIVE_MODEL_NAME = "gemini-1.5-flash-001"
+MAX_CONCURRENT_REVIEWS = 8
+# Duplicate Code is found locally across all files and shown after the model's four sections
+DUPLICATE_SECTION_NUMBER = 5
 RESPONSE_FILE = "review_summary.html"
 
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = GOOGLE_APPLICATION_CREDENTIALS
-vertexai.init(project=PROJECT_ID, location=LOCATION)
+REPORT_STYLE = """
+                body { font-family: Arial, sans-serif; margin: 20px; background-color: #ecf0f1; }
+                h1 { color: #34495E; text-align: center; }
+"""
 
-model = GenerativeModel(GENERATIVE_MODEL_NAME)
+# Vertex AI is initialized on the first model call, so cached runs never load the SDK
+model = LazyModel(GENERATIVE_MODEL_NAME, PROJECT_ID, LOCATION, GOOGLE_APPLICATION_CREDENTIALS)
+review_cache = cache_from_argv()
+usage = UsageRecorder()
 
 def read_file_content(file_path):
     if os.path.exists(file_path):
@@ -21,16 +35,11 @@ def read_file_content(file_path):
             return file.read()
     return None
 
-def add_line_numbers(code_content):
-    lines = code_content.split('\n')
-    numbered_lines = [f"Line {i + 1}: {line}" for i, line in enumerate(lines)]
-    return '\n'.join(numbered_lines)
-
 def sanitize_html(html_content):
     soup = BeautifulSoup(html_content, 'html.parser')
     return str(soup)
 
-def generate_review(code_content):
+def generate_review(code_content, label="review"):
     prompt = f"""You are an intelligent code analyst. Please analyze the provided code snippet and provide the following information:
  
 1. Syntax Errors:
@@ -51,12 +60,7 @@ def generate_review(code_content):
     - Fix: Suggest code changes to mitigate the security risks without rewriting the entire code.
     - Note: If no security vulnerabilities are found, generate a table with "No Security Vulnerabilities Found" in normal font (Times New Roman).
  
-4. Duplicate Code:
-    - Identification: Highlight sections of the code lines that are duplicated.
-    - Suggestion: Provide recommendations without rewriting the entire code.
-    - Note: If no duplicate code is found, generate a table with "No duplicate code in this file" in normal font (Times New Roman).
- 
-5. Code Improvement Suggestions:
+4. Code Improvement Suggestions:
     - Identification: Highlight sections of the code that can be improved.
         - This could include:
         - Unnecessary complexity
@@ -65,9 +69,9 @@ def generate_review(code_content):
     - Suggestion: Provide specific points for improvement and the necessary code changes without rewriting the entire code.
     - Note: If no code improvement suggestions are found, generate a table with "No Code Improvement Suggestions Found" in normal font (Times New Roman).
  
-6. Do not write any code snippet in the output.
+5. Do not write any code snippet in the output.
  
-7. Generate the output in purely HTML format with consistent table formatting for each section:
+6. Generate the output in purely HTML format with consistent table formatting for each section:
     - set response table width to 100%
     - strictly use only the 100% of the page not more than that
     - strictly do not give any headings for review response of file
@@ -81,14 +85,14 @@ def generate_review(code_content):
         - ensure all headings, section headings, content, file names, and paths should be left-aligned and text color is black.
         - make sure that line number is present in present in identification column itself(no more column containing line numbers)
         - ensure that Identification, Explanation and Fix are the only column names for Syntax Errors, Code Bugs, Security Vulnerabilities sections and
-          identification, suggestion are the only column names for duplicate code and code improvement suggestions
+          identification, suggestion are the only column names for code improvement suggestions
            - strictly no other columns are allowed.
  
-8. Headings like "Syntax Errors", "Code Bugs", "Security Vulnerabilities", "Duplicate Code", and "Code Improvement Suggestions" must be bold and numbered.
+7. Headings like "Syntax Errors", "Code Bugs", "Security Vulnerabilities", and "Code Improvement Suggestions" must be bold and numbered.
     - Ensure the content, such as "No Syntax Errors Found", is in normal font (Times New Roman).
     - Maintain consistent font styles for all headings and content.
  
-9. Page Layout:
+8. Page Layout:
    - The page width must be constrained to 100%, ensuring it does not exceed this width.
    - Use "Overflow-wrap: break-word;" to handle long text gracefully without exceeding the table width.
    - Ensure all tables fit within this page width, with no overflow beyond the page boundaries.
@@ -96,36 +100,59 @@ The Code:
 {code_content}
 """
  
+    generation_config = {
+        "max_output_tokens": 8192,
+        "temperature": 0.5,
+        "top_p": 0.95,
+    }
+    key = cache_key(code_content, prompt, GENERATIVE_MODEL_NAME, generation_config)
+
     try:
-        response = model.generate_content(
-            prompt,
-            generation_config={
-                "max_output_tokens": 8192,
-                "temperature": 0.5,
-                "top_p": 0.95,
-            }
+        review_text = review_cache.fetch(
+            key,
+            lambda: usage.call(label, GENERATIVE_MODEL_NAME, model.generate_content, prompt, generation_config=generation_config).text,
         )
-        return sanitize_html(response.text.strip()) 
+        return sanitize_html(review_text.strip()) 
     except Exception as e:
         return f"Error generating review: {str(e)}"
 
-def review_python_files_in_directory(directory_path):
-    """Reviews all Python files in the specified directory and its subdirectories."""
-    reviews = []  
-    for root, _, files in os.walk(directory_path):  
-        for filename in files:
-            if filename.endswith('.py') or filename.endswith('.sql'):
-                file_path = os.path.join(root, filename)
-                start_time = time.time() 
-
-                code_content = read_file_content(file_path)
-                numbered_code = add_line_numbers(code_content)
-                review = generate_review(numbered_code)
-
-                elapsed_time = time.time() - start_time  
-                print(f"Time taken to review {filename}: {elapsed_time:.2f} seconds")  
-
-                reviews.append(f"""
+def generate_findings(code_content, label="review"):
+    """Reviews one chunk of a long file as JSON findings (see findings.RESPONSE_SCHEMA), so chunks can be merged."""
+    from vertexai.generative_models import GenerationConfig
+
+    prompt = structured_prompt(code_content)
+    generation_config = structured_generation_config({
+        "max_output_tokens": 8192,
+        "temperature": 0.5,
+        "top_p": 0.95,
+    })
+    key = cache_key(code_content, prompt, GENERATIVE_MODEL_NAME, generation_config)
+    return review_cache.fetch(
+        key,
+        lambda: usage.call(label, GENERATIVE_MODEL_NAME, model.generate_content, prompt,
+                           generation_config=GenerationConfig(**generation_config)).text,
+        parse_findings,
+    )
+
+
+def review_file(file_path, duplicates):
+    code_content = read_file_content(file_path)
+    return review_in_chunks(
+        code_content,
+        file_path,
+        lambda numbered_code: generate_review(numbered_code, file_path),
+        lambda numbered_code: generate_findings(numbered_code, file_path),
+    ) + duplicate_section_html(duplicates, DUPLICATE_SECTION_NUMBER)
+
+def review_python_files_in_directory(directory_path, report):
+    """Reviews all Python files in the specified directory and its subdirectories, streaming each review to the report."""
+    file_paths = collect_files(directory_path, ('.py', '.sql'))
+    # Duplicate code is detected locally across all files before any model call
+    duplicates = duplicate_findings(find_clones(file_paths))
+    review_one = lambda file_path: review_file(file_path, duplicates[file_path])
+    for file_path, review, elapsed_time in review_files(file_paths, review_one, MAX_CONCURRENT_REVIEWS):
+        filename = os.path.basename(file_path)
+        report.write_section(f"""
                 <div style="margin-bottom: 20px; border: 1px solid #ccc; padding: 15px; border-radius: 8px; background-color: #f9f9f9;">
                     <h2 style="color: #2C3E50;">Review for {filename}</h2>
                     <p style="font-style: italic; color: #000000;">File Path: {file_path}</p>
@@ -134,8 +161,6 @@ def review_python_files_in_directory(directory_path):
                 </div>
                 """)
 
-    return "\n".join(reviews)  
-
 def main():
     directory_path = "folder-1"
 
@@ -145,32 +170,14 @@ def main():
 
     overall_start_time = time.time()
 
-    reviews_html = review_python_files_in_directory(directory_path)
+    with HtmlReportWriter(RESPONSE_FILE, title="Python Code Review Summary", style=REPORT_STYLE) as report:
+        review_python_files_in_directory(directory_path, report)
 
     overall_elapsed_time = time.time() - overall_start_time
 
-    with open(RESPONSE_FILE, 'w') as output_file:
-        output_file.write(f"""
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Python Code Review Summary</title>
-            <style>
-                body {{ font-family: Arial, sans-serif; margin: 20px; background-color: #ecf0f1; }}
-                h1 {{ color: #34495E; text-align: center; }}
-                pre {{ }}
-            </style>
-        </head>
-        <body>
-            <h1>Python Code Review Summary</h1>
-            {reviews_html}
-        </body>
-        </html>
-        """)
-
     print(f"Total Time Taken for Reviewing all Files: {overall_elapsed_time:.2f} seconds")
+    print(review_cache.stats())
+    print(usage.summary())
     
 if __name__ == "__main__":
     main()
@@ -0,0 +1,71 @@
+import os
+import threading
+
+# Harm categories the review scripts relax to BLOCK_ONLY_HIGH so code samples are not blocked
+SAFETY_CATEGORIES = [
+    "HARM_CATEGORY_HATE_SPEECH",
+    "HARM_CATEGORY_DANGEROUS_CONTENT",
+    "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+    "HARM_CATEGORY_HARASSMENT",
+]
+
+_initialized = set()
+_init_lock = threading.Lock()
+
+
+def init_vertex(project, location, credentials=None):
+    """Imports the Vertex AI SDK and initializes it once per project and location."""
+    with _init_lock:
+        if (project, location) in _initialized:
+            return
+        if credentials:
+            os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials
+        import vertexai
+
+        vertexai.init(project=project, location=location)
+        _initialized.add((project, location))
+
+
+def block_only_high_safety_settings():
+    """Safety settings that block only high-probability harm in SAFETY_CATEGORIES."""
+    from vertexai.generative_models import HarmBlockThreshold, HarmCategory
+
+    return {getattr(HarmCategory, category): HarmBlockThreshold.BLOCK_ONLY_HIGH for category in SAFETY_CATEGORIES}
+
+
+class LazyModel:
+    """Stands in for a GenerativeModel and only initializes Vertex AI on the first model call.
+
+    Importing a review script, printing --help or serving every file from the review cache
+    therefore never imports the SDK or resolves credentials. build, when given, returns the
+    real model (e.g. prompt_cache.build_review_model) and is called after initialization.
+    """
+
+    def __init__(self, model_name, project, location, credentials=None, build=None, **model_kwargs):
+        self.model_name = model_name
+        self.project = project
+        self.location = location
+        self.credentials = credentials
+        self.build = build
+        self.model_kwargs = model_kwargs
+        self._model = None
+        self._lock = threading.Lock()
+
+    def model(self):
+        """Returns the real model, initializing Vertex AI and building it on first use."""
+        with self._lock:
+            if self._model is None:
+                init_vertex(self.project, self.location, self.credentials)
+                if self.build is not None:
+                    self._model = self.build()
+                else:
+                    from vertexai.generative_models import GenerativeModel
+
+                    self._model = GenerativeModel(self.model_name, **self.model_kwargs)
+            return self._model
+
+    def generate_content(self, *args, **kwargs):
+        return self.model().generate_content(*args, **kwargs)
+
+    def count_tokens(self, *args, **kwargs):
+        return self.model().count_tokens(*args, **kwargs)